@@ -0,0 +1,232 @@
+"""Benchmarks for the neosensory_python SDK layer.
+
+Measures motor command encoding throughput, illusion computation
+throughput, and source-to-playback latency and delivery jitter against
+the in-process Buzz simulator. Results are printed and can be
+saved as JSON for comparison across versions:
+
+    python benchmarks/bench.py --output results.json
+    python benchmarks/bench.py --compare results.json
+"""
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import sys
+import time
+
+from neosensory_python import NeoDevice, get_buzz_illusion_activations
+from neosensory_python import motor_frame_period
+from neosensory_python.__version__ import __version__
+from neosensory_python.simulator import SimulatedBuzzClient
+
+try:
+    import numpy as np
+    from neosensory_python.batch import get_buzz_illusion_activations_batch
+except ImportError:
+    np = None
+
+
+class _NullClient:
+    """A client whose writes complete immediately and do nothing"""
+    mtu_size = 247
+
+    async def write_gatt_char(self, char_specifier, data, response=False):
+        pass
+
+
+def _rate(count, seconds):
+    return count / seconds if seconds > 0 else float("inf")
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def bench_vibrate_encoding(num_frames):
+    """Frames per second through NeoDevice.vibrate_motors, one write each"""
+    device = NeoDevice(_NullClient())
+    frames = [[i % 256, (i * 3) % 256, (i * 7) % 256, 255 - i % 256]
+        for i in range(num_frames)]
+
+    async def run():
+        start = time.perf_counter()
+        for frame in frames:
+            await device.vibrate_motors(frame)
+        return time.perf_counter() - start
+
+    elapsed = _run(run())
+    return {"frames_per_sec": _rate(num_frames, elapsed)}
+
+
+def bench_batch_encoding(num_frames):
+    """Frames per second through the encoder for MTU-sized batches"""
+    device = NeoDevice(_NullClient())
+    frames_per_write = device.get_max_frames_per_write()
+    data = bytes(i % 256 for i in range(num_frames * 4))
+    step = frames_per_write * 4
+    encode = device._encoder.encode
+    start = time.perf_counter()
+    for i in range(0, len(data), step):
+        encode(data[i:i + step])
+    elapsed = time.perf_counter() - start
+    return {"frames_per_sec": _rate(num_frames, elapsed),
+        "frames_per_write": frames_per_write}
+
+
+def bench_illusion(num_frames):
+    """Illusion frames computed per second, scalar and (if available)
+        vectorized
+    """
+    intensities = [(i % 100) / 100 for i in range(num_frames)]
+    locations = [(i % 997) / 997 for i in range(num_frames)]
+    start = time.perf_counter()
+    for intensity, location in zip(intensities, locations):
+        get_buzz_illusion_activations(intensity, location, 0, 255, 4)
+    results = {"scalar_frames_per_sec": _rate(num_frames,
+        time.perf_counter() - start)}
+    if np is not None:
+        intensities = np.asarray(intensities)
+        locations = np.asarray(locations)
+        start = time.perf_counter()
+        get_buzz_illusion_activations_batch(intensities, locations, 0, 255, 4)
+        results["batch_frames_per_sec"] = _rate(num_frames,
+            time.perf_counter() - start)
+    return results
+
+
+def bench_stream_latency(num_frames, latency):
+    """Source-to-playback latency and delivery jitter when streaming a
+        real-time source through the simulator with the given one-way
+        link latency. Frames are timestamped when the source yields
+        them and when the write carrying them completes on the host.
+    """
+    yield_times = []
+    arrival_times = []
+
+    async def source():
+        # one frame per device tick, on absolute deadlines
+        start = time.monotonic()
+        for i in range(num_frames):
+            yield_times.append(time.monotonic())
+            yield [i % 256, 0, 0, 0]
+            await asyncio.sleep(max(0.0, start + (i + 1) * motor_frame_period
+                - time.monotonic()))
+
+    async def run():
+        client = SimulatedBuzzClient(latency=latency, record_playback=True)
+        write = client.write_gatt_char
+
+        async def timed_write(char_specifier, data, response=False):
+            received = client.frames_received
+            await write(char_specifier, data, response)
+            arrival_times.extend([time.monotonic()]
+                * (client.frames_received - received))
+
+        client.write_gatt_char = timed_write
+        async with client:
+            device = NeoDevice(client)
+            await device.request_developer_authorization()
+            await device.accept_developer_api_terms()
+            await device.pause_device_algorithm()
+            start = time.perf_counter()
+            await device.stream_frames(source())
+            elapsed = time.perf_counter() - start
+            # let the queued frames play out
+            await asyncio.sleep(client.get_queue_depth()
+                * motor_frame_period + 0.05)
+            client.get_queue_depth()
+        return client, elapsed
+
+    client, elapsed = _run(run())
+    latencies = [play - produced for produced, (_, play, _)
+        in zip(yield_times, client.playback_log)]
+    delays = [arrival - produced for produced, arrival
+        in zip(yield_times, arrival_times)]
+    # variation in delivery delay between consecutive frames
+    jitter = [abs(b - a) for a, b in zip(delays, delays[1:])]
+    return {
+        "frames_played": len(client.playback_log),
+        "stream_frames_per_sec": _rate(num_frames, elapsed),
+        "latency_mean_ms": statistics.mean(latencies) * 1000,
+        "latency_p99_ms": _percentile(latencies, 0.99) * 1000,
+        "delivery_mean_ms": statistics.mean(delays) * 1000,
+        "jitter_mean_ms": statistics.mean(jitter) * 1000 if jitter else 0.0,
+        "jitter_max_ms": max(jitter) * 1000 if jitter else 0.0,
+        "underruns": client.underruns,
+        "overflowed_frames": client.overflowed_frames,
+    }
+
+
+def _run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def run_benchmarks(quick=False):
+    """Run all benchmarks
+
+    Args:
+        quick: use fewer iterations, for smoke testing
+
+    Returns:
+        A dict of results keyed by benchmark name
+    """
+    scale = 1 if quick else 10
+    return {
+        "vibrate_encoding": bench_vibrate_encoding(2000 * scale),
+        "batch_encoding": bench_batch_encoding(20000 * scale),
+        "illusion": bench_illusion(5000 * scale),
+        "stream_latency": bench_stream_latency(50 * scale, 0.01),
+    }
+
+
+def compare(results, baseline):
+    """Print each metric next to its value in a baseline result file"""
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline.get(name, {}).get(metric)
+            if isinstance(old, (int, float)) and old:
+                change = "{:+.1f}%".format((value - old) / old * 100)
+            else:
+                change = "n/a"
+            print("{:<18} {:<24} {:>14.3f} {:>14} {:>9}".format(name, metric,
+                value, "-" if old is None else "{:.3f}".format(old), change))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="write results as JSON to a file")
+    parser.add_argument("--compare", help="JSON results to compare against")
+    parser.add_argument("--quick", action="store_true",
+        help="run fewer iterations")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.quick)
+    report = {
+        "version": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__ if np is not None else None,
+        "timestamp": time.time(),
+        "results": results,
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f)["results"])
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
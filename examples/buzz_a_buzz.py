@@ -1,59 +1,41 @@
 import asyncio
-from bleak import BleakClient
-from bleak import discover
-from neosensory_python import NeoDevice
+from neosensory_python.connection import NeoConnection
+from neosensory_python.scheduler import FrameScheduler
 
 
 def notification_handler(sender, data):
     print("{0}: {1}".format(sender, data))
 
 
-async def run(loop):
+def motor_pattern():
+    motor_vibrate_frame = [0, 0, 0, 0]
+    motor_pattern_index = 0
+    motor_pattern_value = 0
+    while True:
+        yield motor_vibrate_frame
+        motor_pattern_index = (motor_pattern_index + 1) % 4
+        motor_pattern_value = (motor_pattern_value + 20) % 255
+        motor_vibrate_frame[motor_pattern_index] = motor_pattern_value
 
-    # "X" will  get overwritten if a Buzz is found
-    buzz_addr = "X"  # e.g. "EB:CA:85:38:19:1D"
-    devices = await discover()
-    for d in devices:
-        if str(d).find("Buzz") > 0:
-            print("Found a Buzz! " + str(d) +
-             "\r\nAddress substring: " + str(d)[:17])
-            # set the address to a found Buzz
-            buzz_addr = str(d)[:17]
 
-    async with BleakClient(buzz_addr, loop=loop) as client:
+async def run():
 
-        my_buzz = NeoDevice(client)
+    # connects straight to the last Buzz used, scanning only if there is
+    # none, and sets up the developer session without fixed delays. If
+    # the connection drops, it is re-established in the background.
+    async with NeoConnection(
+            notification_handler=notification_handler) as my_buzz:
 
-        await asyncio.sleep(1)
-
-        x = await client.is_connected()
-        print("Connection State: {0}\r\n".format(x))
-
-        await my_buzz.enable_notifications(notification_handler)
-
-        await asyncio.sleep(1)
-
-        await my_buzz.request_developer_authorization()
-
-        await my_buzz.accept_developer_api_terms()
-
-        await my_buzz.pause_device_algorithm()
-
-        motor_vibrate_frame = [0, 0, 0, 0]
-        motor_pattern_index = 0
-        motor_pattern_value = 0
+        print("Connected to {0}\r\n".format(my_buzz.client.address))
 
         try:
-            while True:
-                await asyncio.sleep(0.1)
-                await my_buzz.vibrate_motors(motor_vibrate_frame)
-                motor_pattern_index = (motor_pattern_index + 1) % 4
-                motor_pattern_value = (motor_pattern_value + 20) % 255
-                motor_vibrate_frame[motor_pattern_index] = motor_pattern_value
+            # play a new frame every 6 device ticks (96 ms)
+            await FrameScheduler(my_buzz).play(motor_pattern(),
+                interval_ticks=6)
         except KeyboardInterrupt:
             await my_buzz.resume_device_algorithm()
             pass
 
 if __name__ == "__main__":
     loop = asyncio.get_event_loop()
-    loop.run_until_complete(run(loop))
+    loop.run_until_complete(run())
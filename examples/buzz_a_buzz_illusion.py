@@ -1,63 +1,39 @@
 import asyncio
-from bleak import BleakClient
-from bleak import discover
-from neosensory_python import NeoDevice
 from neosensory_python import get_buzz_illusion_activations
+from neosensory_python.connection import NeoConnection
+from neosensory_python.scheduler import FrameScheduler
 
 
 def notification_handler(sender, data):
     print("{0}: {1}".format(sender, data))
 
 
-async def run(loop):
+async def run():
 
-    # "X" will  get overwritten if a Buzz is found
-    buzz_addr = "X" # e.g. "EB:CA:85:38:19:1D"
-    # scan for a buzz
-    devices = await discover()
-    for d in devices:
-        if str(d).find("Buzz") > 0:
-            print("Found a Buzz! " + str(d) +
-             "\r\nAddress substring: " + str(d)[:17])
-            # set the address to a found Buzz
-            buzz_addr = str(d)[:17]
+    # connects straight to the last Buzz used, scanning only if there is
+    # none, and sets up the developer session without fixed delays. If
+    # the connection drops, it is re-established in the background.
+    async with NeoConnection(
+            notification_handler=notification_handler) as my_buzz:
 
-    # Initiate the connection. If a buzz has not been found
-    # the script will throw an error
-    async with BleakClient(buzz_addr, loop=loop) as client:
+        print("Connected to {0}\r\n".format(my_buzz.client.address))
 
-        # create a NeoDevice object and assign it 
-        # the BleakClient object
-        my_buzz = NeoDevice(client)
-
-        await asyncio.sleep(1)
-
-        x = await client.is_connected()
-        print("Connection State: {0}\r\n".format(x))
-
-        await my_buzz.enable_notifications(notification_handler)
-
-        await asyncio.sleep(1)
-
-        await my_buzz.request_developer_authorization()
-
-        await my_buzz.accept_developer_api_terms()
-
-        await my_buzz.pause_device_algorithm()
-
-        illusion_location = 0
         illusion_intensity = 0.5
 
+        def illusion_frame(tick):
+            # move the illusion 0.01 around the wrist every 6 device
+            # ticks (96 ms)
+            illusion_location = (tick // 6 * 0.01) % 1
+            return get_buzz_illusion_activations(illusion_intensity,
+                illusion_location, 0, 255, 4)
+
         try:
-            while True:
-                await asyncio.sleep(0.1)
-                await my_buzz.vibrate_motors(get_buzz_illusion_activations
-                    (illusion_intensity, illusion_location, 0, 255, 4))
-                illusion_location = (illusion_location + 0.01) % 1
+            await FrameScheduler(my_buzz).play(illusion_frame,
+                interval_ticks=6)
         except KeyboardInterrupt:
             await my_buzz.resume_device_algorithm()
             pass
 
 if __name__ == "__main__":
     loop = asyncio.get_event_loop()
-    loop.run_until_complete(run(loop))
+    loop.run_until_complete(run())
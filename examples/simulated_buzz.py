@@ -0,0 +1,38 @@
+import asyncio
+from neosensory_python import NeoDevice
+from neosensory_python import get_buzz_illusion_activations
+from neosensory_python.simulator import SimulatedBuzzClient
+
+
+def notification_handler(sender, data):
+    print("{0}: {1}".format(sender, data))
+
+
+async def run():
+
+    # the simulator stands in for a BleakClient connected to a Buzz
+    async with SimulatedBuzzClient(latency=0.01) as client:
+
+        my_buzz = NeoDevice(client)
+
+        await my_buzz.enable_notifications(notification_handler)
+
+        await my_buzz.request_developer_authorization()
+
+        await my_buzz.accept_developer_api_terms()
+
+        await my_buzz.pause_device_algorithm()
+
+        # sweep an illusory point around the wrist, one frame per 16 ms
+        frames = [get_buzz_illusion_activations(0.5, i / 100, 0, 255, 4)
+            for i in range(100)]
+        await my_buzz.stream_frames(frames)
+
+        print("Frames received: {0}, played so far: {1}".format(
+            client.frames_received, client.frames_played))
+
+        await my_buzz.resume_device_algorithm()
+
+if __name__ == "__main__":
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(run())
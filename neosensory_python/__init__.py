@@ -1,11 +1,30 @@
-import base64
+import asyncio
+import time
 import uuid
 import math
 
+from . import encoding
+from .commands import CommandQueue, priority_command, priority_control, \
+    priority_frames
+from .encoding import MotorCommandEncoder
+from .metrics import DeviceMetrics
+from .responses import ResponseRouter, find_response_value, has_response_key
+
 # The GATT Characteristic used for writing to Neosensory Buzz
 ns_uart_rx_id = uuid.UUID('6E400002-B5A3-F393-E0A9-E50E24DCCA9E')
 # The GATT Characteristic used for getting response notifications from Buzz
 ns_uart_tx_id = uuid.UUID('6E400003-B5A3-F393-E0A9-E50E24DCCA9E')
+# The period (in seconds) on which Buzz plays out queued motor frames
+motor_frame_period = 0.016
+# The assumed capacity (in frames) of the device's motor FIFO queue
+motor_queue_size = 32
+# Seconds to wait for the device to answer a query command
+default_response_timeout = 2.0
+# The ATT MTU assumed when the client does not report a negotiated one
+default_mtu = 23
+# The longest value a GATT characteristic write can carry, in bytes. The
+# BLE stack sends writes longer than the MTU allows as long writes.
+max_attribute_length = 512
 
 
 class NeoDevice:
@@ -13,24 +32,84 @@ class NeoDevice:
 
     """
 
-    def __init__(self, client):
+    def __init__(self, client, mtu=None):
         self.client = client
+        self.mtu = mtu
+        # monotonic time at which the device's motor queue is expected
+        # to run empty, given everything written so far
+        self._queue_drain_time = 0.0
+        self._encoder = MotorCommandEncoder()
+        self.responses = ResponseRouter()
+        self._notifications_enabled = False
+        self._notification_handler = None
+        self.metrics = None
+        self.commands = CommandQueue(self)
+        # a FrameRecorder (see neosensory_python.recording) or None
+        self.recorder = None
+        # session state set up over the CLI, restored by restore_session
+        self.developer_authorized = False
+        self.audio_stopped = False
+        self.motors_enabled = False
 
     def set_client(self, new_client):
-        """Set the Bleak client object
+        """Set the Bleak client object. Notifications have to be enabled
+            again on the new client, and the motor queue of the device is
+            assumed to be empty.
 
         Args:
             new_client: the Bleak client object
         """
         self.client = new_client
+        self._notifications_enabled = False
+        self._queue_drain_time = 0.0
+        self.commands.forget_held_frame()
 
-    async def enable_notifications(self, handler):
-        """Enable notifications to be sent back to host computer
+    async def enable_notifications(self, handler=None):
+        """Enable notifications to be sent back to host computer. Received
+            data is also parsed by the device's response router, which is
+            what lets query methods return the device's answer.
 
         Args:
             handler: the handler function that processes the received reponse
         """
-        await self.client.start_notify(ns_uart_tx_id, handler)
+        self._notification_handler = handler
+        if not self._notifications_enabled:
+            await self.client.start_notify(ns_uart_tx_id,
+                self._handle_notification)
+            self._notifications_enabled = True
+
+    def _handle_notification(self, sender, data):
+        self.responses.feed(data)
+        if self._notification_handler is not None:
+            self._notification_handler(sender, data)
+
+    async def request(self, command, matcher=None,
+            timeout=default_response_timeout):
+        """Send a command and wait for the device's response to it.
+            Notifications are enabled first if needed.
+
+        Args:
+            command: command string or pre-encoded bytes, e.g. "device info"
+
+            matcher: a function taking a parsed message (dict for JSON
+                responses, str for lines of text) and returning whether it
+                is the response. If None, the next message is the response.
+
+            timeout: seconds to wait before raising asyncio.TimeoutError
+
+        Returns:
+            The parsed response message
+        """
+        if not self._notifications_enabled:
+            await self.enable_notifications(self._notification_handler)
+        if isinstance(command, str):
+            command = command.encode("utf-8")
+        future = self.responses.expect(matcher)
+        try:
+            await self._write(command)
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self.responses.cancel(future)
 
     async def send_command(self, command):
         """Send a custom API command to Neosensory device
@@ -38,8 +117,58 @@ class NeoDevice:
         Args:
             command: command string, e.g. "device info"
         """
-        cmd = command.encode("utf-8")
-        await self.client.write_gatt_char(ns_uart_rx_id, cmd)
+        await self._write(command.encode("utf-8"))
+
+    def enable_metrics(self, exporter=None, export_interval=None):
+        """Start collecting per-command write latencies, write and frame
+            counts and the estimated device queue depth in self.metrics.
+            Metrics are off by default and cost nothing while off.
+
+        Args:
+            exporter: a function called with metric snapshots (dicts)
+
+            export_interval: if given, call exporter automatically at most
+                this often (in seconds)
+
+        Returns:
+            The DeviceMetrics object now collecting metrics
+        """
+        self.metrics = DeviceMetrics(exporter, export_interval)
+        return self.metrics
+
+    def disable_metrics(self):
+        """Stop collecting metrics"""
+        self.metrics = None
+
+    async def _write(self, payload, priority=priority_command):
+        # queue a command and wait until it has been written
+        await self.commands.write(payload, priority)
+
+    async def _write_frames(self, frame_data, num_frames, coalesce=False):
+        # the command queue copies frame_data if it has to wait its turn
+        await self.commands.write(frame_data, priority_frames, num_frames,
+            raw_frames=True, coalesce=coalesce)
+
+    async def _transmit(self, payload, num_frames=0, frame_data=None):
+        # called by the command queue, one write at a time. Bleak backends
+        # copy the payload before their first await, so views into the
+        # encoder's reusable buffer are safe to pass on.
+        metrics = self.metrics
+        if metrics is None:
+            await self.client.write_gatt_char(ns_uart_rx_id, payload)
+        else:
+            start = time.perf_counter()
+            await self.client.write_gatt_char(ns_uart_rx_id, payload)
+            metrics.record_write(payload, time.perf_counter() - start,
+                num_frames)
+        if num_frames:
+            if self.recorder is not None:
+                if frame_data is None:
+                    frame_data = encoding.decode_vibrate_command(payload)
+                # frames start playing once those already queued are done
+                self.recorder.record(frame_data, num_frames,
+                    max(time.monotonic(), self._queue_drain_time))
+            self._account_frames(num_frames)
 
     async def request_developer_authorization(self):
         """Request developer authorization. The CLI returns the message
@@ -47,8 +176,7 @@ class NeoDevice:
             Inc's Developer Terms and Conditions, which can be viewed at
             https://neosensory.com/legal/dev-terms-service
         """
-        cmd = ("auth as developer\r\n").encode("utf-8")
-        await self.client.write_gatt_char(ns_uart_rx_id, cmd)
+        await self._write(encoding.auth_as_developer_command)
 
     async def accept_developer_api_terms(self):
         """After successfully calling auth as developer, use the accept
@@ -58,8 +186,76 @@ class NeoDevice:
             audio start, audio stop, motors_clear_queue, motors start,
             motors_stop, motors vibrate.
         """
-        cmd = ("accept\r\n").encode("utf-8")
-        await self.client.write_gatt_char(ns_uart_rx_id, cmd)
+        await self._write(encoding.accept_command)
+        self.developer_authorized = True
+
+    async def start_developer_session(self, pause_algorithm=True,
+            timeout=default_response_timeout):
+        """Authorize as a developer, accept the developer terms and
+            optionally pause the device algorithm, without waiting
+            between commands. All commands are queued at once, followed
+            by a battery level query: the CLI runs commands in order, so
+            its answer means every command before it has run.
+
+        Args:
+            pause_algorithm: whether to also stop audio and start the
+                motors, like pause_device_algorithm
+
+            timeout: seconds to wait before raising asyncio.TimeoutError
+
+        Raises:
+            RuntimeError: if the device reports an error
+        """
+        await self._start_session(pause_algorithm, pause_algorithm, timeout)
+
+    async def restore_session(self, timeout=default_response_timeout):
+        """Set up the session state again, e.g. after reconnecting: the
+            developer authorization, stopped audio and started motors
+            requested earlier are requested again in one round trip. Does
+            nothing if the device was never authorized.
+
+        Args:
+            timeout: seconds to wait before raising asyncio.TimeoutError
+
+        Raises:
+            RuntimeError: if the device reports an error
+        """
+        if self.developer_authorized:
+            await self._start_session(self.audio_stopped,
+                self.motors_enabled, timeout)
+
+    async def _start_session(self, stop_audio, start_motors, timeout):
+        commands = [encoding.auth_as_developer_command,
+            encoding.accept_command]
+        if stop_audio:
+            commands += [encoding.audio_stop_command,
+                encoding.motors_clear_queue_command]
+        if start_motors:
+            commands.append(encoding.motors_start_command)
+        commands.append(encoding.device_battery_soc_command)
+        if not self._notifications_enabled:
+            await self.enable_notifications(self._notification_handler)
+        failed = self.responses.expect(_is_error_response)
+        done = self.responses.expect(has_response_key("battery_soc"))
+        try:
+            await asyncio.gather(*[self.commands.submit(command)
+                for command in commands])
+            await asyncio.wait([failed, done], timeout=timeout,
+                return_when=asyncio.FIRST_COMPLETED)
+            if failed.done():
+                raise RuntimeError("Device reported: {}".format(
+                    failed.result()))
+            if not done.done():
+                raise asyncio.TimeoutError()
+        finally:
+            self.responses.cancel(failed)
+            self.responses.cancel(done)
+        self.developer_authorized = True
+        if stop_audio:
+            self.audio_stopped = True
+            self._queue_drain_time = 0.0
+        if start_motors:
+            self.motors_enabled = True
 
     async def resume_device_algorithm(self):
         """(Re)starts the device’s microphone audio acquisition and
@@ -67,16 +263,16 @@ class NeoDevice:
             authorization, otherwise, the command will fail. This
             is functionally the same as startAudio()
         """
-        cmd = ("audio start\r\n").encode("utf-8")
-        await self.client.write_gatt_char(ns_uart_rx_id, cmd)
+        await self._write(encoding.audio_start_command)
+        self.audio_stopped = False
 
     async def start_audio(self):
         """(Re)starts the device’s microphone audio acquisition.
             This command requires successful developer authorization,
             otherwise, the command will fail.
         """
-        cmd = ("audio start\r\n").encode("utf-8")
-        await self.client.write_gatt_char(ns_uart_rx_id, cmd)
+        await self._write(encoding.audio_start_command)
+        self.audio_stopped = False
 
     async def stop_audio(self):
         """Stop the device’s microphone audio acquisition.
@@ -84,32 +280,49 @@ class NeoDevice:
             This command requires successful developer authorization,
             otherwise, the command will fail.
         """
-        cmd = ("audio stop\r\n").encode("utf-8")
-        await self.client.write_gatt_char(ns_uart_rx_id, cmd)
+        await self._write(encoding.audio_stop_command)
+        self.audio_stopped = True
         await self.clear_motor_queue()
 
-    async def get_battery_level(self):
+    async def get_battery_level(self, timeout=default_response_timeout):
         """Obtain the device’s battery level in %.
             This command does not require developer authorization
+
+        Args:
+            timeout: seconds to wait before raising asyncio.TimeoutError
+
+        Returns:
+            The battery state of charge reported by the device
         """
-        cmd = ("device battery_soc\r\n").encode("utf-8")
-        await self.client.write_gatt_char(ns_uart_rx_id, cmd)
+        response = await self.request(encoding.device_battery_soc_command,
+            has_response_key("battery_soc"), timeout)
+        return find_response_value(response, "battery_soc")
 
-    async def get_device_info(self):
+    async def get_device_info(self, timeout=default_response_timeout):
         """Obtain various device and firmware information.
             This command does not require developer authorization.
+
+        Args:
+            timeout: seconds to wait before raising asyncio.TimeoutError
+
+        Returns:
+            A dict of the device information reported by the device
         """
-        cmd = ("device info\r\n").encode("utf-8")
-        await self.client.write_gatt_char(ns_uart_rx_id, cmd)
+        return await self.request(encoding.device_info_command,
+            lambda message: isinstance(message, dict), timeout)
 
     async def clear_motor_queue(self):
         """Clear any vibration commands sitting the device’s motor FIFO queue.
             This should be called prior to streaming control frames using
             motors vibrate. This command requires successful developer
             authorization, otherwise, the command will fail.
+            Motor frames not yet sent are dropped, and the command is
+            sent ahead of any other queued commands.
         """
-        cmd = ("motors clear_queue\r\n").encode("utf-8")
-        await self.client.write_gatt_char(ns_uart_rx_id, cmd)
+        self.commands.preempt()
+        await self._write(encoding.motors_clear_queue_command,
+            priority_control)
+        self._queue_drain_time = 0.0
 
     async def enable_motors(self):
         """Initialize and start the motors interface.
@@ -117,16 +330,18 @@ class NeoDevice:
             This command requires successful developer authorization,
             otherwise, the command will fail.
         """
-        cmd = ("motors start\r\n").encode("utf-8")
-        await self.client.write_gatt_char(ns_uart_rx_id, cmd)
+        await self._write(encoding.motors_start_command)
+        self.motors_enabled = True
 
     async def disable_motors(self):
         """Clear the motors command queue and shut down the
             motor drivers. This command requires successful developer
             authorization, otherwise, the command will fail.
         """
-        cmd = ("motors stop\r\n").encode("utf-8")
-        await self.client.write_gatt_char(ns_uart_rx_id, cmd)
+        self.commands.preempt()
+        await self._write(encoding.motors_stop_command, priority_control)
+        self._queue_drain_time = 0.0
+        self.motors_enabled = False
 
     async def stop_motors(self):
         """Send a frame that turns off the motors. Note: the API
@@ -134,8 +349,17 @@ class NeoDevice:
             This command requires successful developer authorization,
             otherwise, the command will fail.
             Assumes this is a 4-motor device (e.g. Neosensory Buzz)
+            Frames not yet sent and those queued on the device are
+            dropped first, so the motors stop right away.
         """
-        await self.vibrate_motors([0, 0, 0, 0])
+        self.commands.preempt()
+        cleared = self.commands.submit(encoding.motors_clear_queue_command,
+            priority_control)
+        stopped = self.commands.submit(bytes(4), priority_control, 1,
+            raw_frames=True)
+        await cleared
+        self._queue_drain_time = 0.0
+        await stopped
 
     async def pause_device_algorithm(self):
         """Pause the running algorithm on the device to accept motor
@@ -159,9 +383,207 @@ class NeoDevice:
 
         """
 
-        motor_command_string = "motors vibrate \"{}\"\r\n".format(base64.
-            b64encode(bytearray(motor_list)).decode('utf-8')).encode("utf-8")
-        await self.client.write_gatt_char(ns_uart_rx_id, motor_command_string)
+        if not isinstance(motor_list, (bytes, bytearray, memoryview)):
+            try:
+                motor_list = memoryview(motor_list)
+            except TypeError:
+                motor_list = bytes(motor_list)
+        if getattr(motor_list, "itemsize", 1) != 1:
+            raise ValueError("Motor data must be one byte per value, got an "
+                "item size of {}".format(motor_list.itemsize))
+        num_bytes = getattr(motor_list, "nbytes", None) or len(motor_list)
+        # a frame repeating the one the device holds may be skipped
+        await self._write_frames(motor_list, max(1, num_bytes // 4),
+            coalesce=True)
+
+    def get_max_frames_per_write(self, num_motors=4):
+        """Get the number of frames that fit in a single motors vibrate
+            write given the negotiated MTU. At least one frame is always
+            allowed, relying on the BLE stack for long writes.
+
+        Args:
+            num_motors: number of motors on the device (4 for Neosensory Buzz)
+
+        Returns:
+            The maximum number of frames to pack into one write
+        """
+        mtu = self.mtu
+        if mtu is None:
+            mtu = getattr(self.client, "mtu_size", None) or default_mtu
+        # the ATT header takes 3 bytes of every write
+        b64_chars = mtu - 3 - encoding.vibrate_command_overhead
+        max_bytes = max(0, b64_chars) // 4 * 3
+        return max(1, max_bytes // num_motors)
+
+    def estimate_queue_depth(self):
+        """Estimate how many frames are waiting in the device's motor FIFO
+            queue, based on what has been written and the 16 ms play out
+            period.
+
+        Returns:
+            The estimated number of queued frames
+        """
+        remaining = self._queue_drain_time - time.monotonic()
+        if remaining <= 0:
+            return 0
+        return int(math.ceil(remaining / motor_frame_period))
+
+    def _account_frames(self, num_frames):
+        # called once a write of num_frames frames has completed
+        now = time.monotonic()
+        drain_time = self._queue_drain_time
+        self._queue_drain_time = (max(now, drain_time)
+            + num_frames * motor_frame_period)
+        if self.metrics is not None:
+            if 0 < drain_time < now:
+                # the device ran out of frames before these arrived, so
+                # every one of them plays late
+                self.metrics.late_frames += num_frames
+            self.metrics.record_queue_depth(self.estimate_queue_depth())
+
+    async def _wait_for_queue_space(self, num_frames, queue_size):
+        # sleep until the device has played out enough frames for
+        # num_frames more to fit in its queue
+        free_at = (self._queue_drain_time
+            - (queue_size - num_frames) * motor_frame_period)
+        delay = free_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _send_frame_batch(self, frame_data, num_frames,
+            queue_size=motor_queue_size):
+        await self._wait_for_queue_space(num_frames, queue_size)
+        await self._write_frames(frame_data, num_frames)
+
+    async def play_pattern(self, pattern, queue_size=motor_queue_size):
+        """Play a compiled pattern (see neosensory_python.patterns),
+            sending its pre-encoded writes as the device's motor queue
+            has room for them. Writes longer than the MTU allows go out
+            as long writes.
+
+        Args:
+            pattern: a CompiledPattern
+
+            queue_size: capacity of the device's motor queue in frames
+
+        Returns:
+            The number of frames sent
+        """
+        if max(pattern.frame_counts, default=0) > queue_size:
+            raise ValueError("Pattern was compiled with more frames per "
+                "write than the device's queue holds ({})".format(queue_size))
+        if pattern.max_write_length > max_attribute_length:
+            raise ValueError("Pattern was compiled with writes longer than "
+                "{} bytes".format(max_attribute_length))
+        sent = 0
+        for command, num_frames in pattern.writes():
+            await self._wait_for_queue_space(num_frames, queue_size)
+            await self.commands.write(command, priority_frames, num_frames)
+            sent += num_frames
+        return sent
+
+    async def stream_frames(self, frames, num_motors=4,
+            queue_size=motor_queue_size, low_water_mark=2):
+        """Stream motor frames to the device, packing pending frames into
+            as few motors vibrate writes as the negotiated MTU allows.
+            Writes are paced so the device's motor queue neither
+            overflows nor runs dry while the source keeps up. One write
+            is kept in flight while the next batch is collected. When
+            the device's queue is (or will be, by the time a write
+            arrives) empty, frames are held until enough are pending to
+            cover the write latency, so playback starts with a cushion.
+
+        Args:
+            frames: an iterable or async iterable of frames, each a list
+                (or buffer) of num_motors intensity values on [0,255]
+
+            num_motors: number of motors on the device (4 for Neosensory Buzz)
+
+            queue_size: capacity of the device's motor queue in frames
+
+            low_water_mark: when the estimated queue depth drops to this
+                many frames, plus those the device plays while a write is
+                on its way, all pending frames are sent right away rather
+                than waiting for a full write.
+
+        Returns:
+            The number of frames sent
+        """
+        # keep writes to half the queue so the next one can go out while
+        # the device still has frames to play
+        max_frames = min(self.get_max_frames_per_write(num_motors),
+            max(1, queue_size // 2))
+        batch = bytearray()
+        batch_frames = 0
+        sent = 0
+        # the write in flight, and how long the last write took to reach
+        # the device
+        writing = None
+        write_time = 0.0
+
+        async def send(frame_data, num_frames):
+            nonlocal write_time
+            await self._wait_for_queue_space(num_frames, queue_size)
+            start = time.monotonic()
+            await self._write_frames(frame_data, num_frames)
+            write_time = time.monotonic() - start
+
+        def flush():
+            nonlocal batch, batch_frames, sent, writing
+            # the write keeps this batch, and frames go into a new one
+            writing = asyncio.ensure_future(send(batch, batch_frames))
+            sent += batch_frames
+            batch = bytearray()
+            batch_frames = 0
+
+        try:
+            async for frame in _aiter_frames(frames):
+                frame = bytearray(frame)
+                if len(frame) != num_motors:
+                    raise ValueError("Expected a frame of {} motor values, "
+                        "got {}".format(num_motors, len(frame)))
+                batch += frame
+                batch_frames += 1
+                if writing is not None and (writing.done()
+                        or batch_frames >= max_frames):
+                    await writing
+                    writing = None
+                if writing is not None:
+                    continue
+                # frames still queued when a write sent now arrives. At
+                # none, frames are held until there are enough to cover
+                # the next write's latency again.
+                latency_frames = int(math.ceil(
+                    write_time / motor_frame_period))
+                depth = max(0, self.estimate_queue_depth() - latency_frames)
+                if batch_frames >= max_frames or (depth <= low_water_mark
+                        and (depth or batch_frames
+                        > low_water_mark + latency_frames)):
+                    flush()
+            if writing is not None:
+                await writing
+                writing = None
+            if batch_frames:
+                flush()
+                await writing
+        finally:
+            if writing is not None and not writing.done():
+                writing.cancel()
+        return sent
+
+
+async def _aiter_frames(frames):
+    # accept both plain and async iterables as frame sources
+    if hasattr(frames, "__aiter__"):
+        async for frame in frames:
+            yield frame
+    else:
+        for frame in frames:
+            yield frame
+
+
+def _is_error_response(message):
+    return isinstance(message, str) and "error" in message.lower()
 
 
 def get_motor_intensity(linear_intensity, min_intensity, max_intensity):
@@ -0,0 +1,207 @@
+"""Turning audio into motor frames on the host, for use while the device's
+own algorithm is paused (NeoDevice.pause_device_algorithm). Requires
+NumPy (pip install neosensory-python[numpy]).
+"""
+import wave
+
+import numpy as np
+
+from . import motor_frame_period
+from .batch import get_motor_intensities
+
+
+def read_wav(path, chunk_size=4096):
+    """Read a PCM WAV file in chunks
+
+    Args:
+        path: path of the WAV file
+
+        chunk_size: number of samples per chunk
+
+    Returns:
+        A generator of float32 arrays of shape (samples, channels) with
+        values on [-1,1]. The sample rate is the generator's first value.
+    """
+    with wave.open(str(path), "rb") as wav:
+        width = wav.getsampwidth()
+        channels = wav.getnchannels()
+        if width == 1:
+            dtype, offset, scale = np.uint8, 128.0, 128.0
+        elif width == 2:
+            dtype, offset, scale = np.dtype("<i2"), 0.0, 32768.0
+        elif width == 4:
+            dtype, offset, scale = np.dtype("<i4"), 0.0, 2147483648.0
+        else:
+            raise ValueError("Unsupported WAV sample width of {} bytes"
+                .format(width))
+        yield wav.getframerate()
+        while True:
+            data = wav.readframes(chunk_size)
+            if not data:
+                break
+            samples = np.frombuffer(data, dtype=dtype).astype(np.float32)
+            yield ((samples - offset) / scale).reshape(-1, channels)
+
+
+class AudioHapticsPipeline:
+    """Maps audio to motor frames at the device's 16 ms frame rate. Each
+        frame is computed from the spectrum of a window of audio ending at
+        the frame's time: its energy is split into one logarithmically
+        spaced frequency band per motor, converted to decibels, and
+        mapped to motor intensities through the get_motor_intensity
+        curve. All frames completed by a chunk of audio are computed
+        together with one batched FFT, and only the samples still needed
+        for future windows are kept between chunks.
+
+    Args:
+        sample_rate: audio sample rate in Hz
+
+        num_motors: number of motors (and frequency bands)
+
+        window_size: FFT window length in samples. Defaults to the
+            smallest power of two covering two frame periods.
+
+        min_frequency: lower edge of the lowest band in Hz
+
+        max_frequency: upper edge of the highest band in Hz. Defaults to
+            8 kHz or the Nyquist frequency, whichever is lower.
+
+        min_db: band level (relative to a full scale sine) that maps to
+            no vibration
+
+        max_db: band level that maps to full vibration
+
+        min_intensity: a minimum motor intensity value
+
+        max_intensity: a maximum motor intensity value
+
+        frame_period: seconds between frames
+    """
+
+    def __init__(self, sample_rate, num_motors=4, window_size=None,
+            min_frequency=100.0, max_frequency=None, min_db=-60.0,
+            max_db=0.0, min_intensity=0, max_intensity=255,
+            frame_period=motor_frame_period):
+        self.sample_rate = sample_rate
+        self.num_motors = num_motors
+        self.hop = sample_rate * frame_period
+        if window_size is None:
+            window_size = 1 << int(np.ceil(np.log2(2 * self.hop)))
+        self.window_size = window_size
+        if max_frequency is None:
+            max_frequency = min(8000.0, sample_rate / 2)
+        self.min_db = min_db
+        self.max_db = max_db
+        self.min_intensity = min_intensity
+        self.max_intensity = max_intensity
+
+        window = np.hanning(window_size).astype(np.float32)
+        self._window = window
+        # a full scale sine puts (sum(window) / 2) ** 2 power in its bin
+        self._reference_power = (window.sum() / 2) ** 2
+
+        frequencies = np.fft.rfftfreq(window_size, 1.0 / sample_rate)
+        edges = np.geomspace(min_frequency, max_frequency, num_motors + 1)
+        bands = np.zeros((len(frequencies), num_motors), dtype=np.float32)
+        for i in range(num_motors):
+            in_band = (frequencies >= edges[i]) & (frequencies < edges[i + 1])
+            if not in_band.any():
+                # a band narrower than a bin takes the nearest bin
+                center = np.sqrt(edges[i] * edges[i + 1])
+                in_band[np.argmin(np.abs(frequencies - center))] = True
+            bands[in_band, i] = 1.0
+        self._bands = bands
+        self.reset()
+
+    def reset(self):
+        """Forget buffered audio and start again from frame 0"""
+        # audio before the first sample is silence
+        self._buffer = np.zeros(self.window_size, dtype=np.float32)
+        # absolute sample index of self._buffer[0]
+        self._buffer_start = -self.window_size
+        self._next_frame = 0
+
+    def process(self, samples):
+        """Add audio and compute the frames it completes
+
+        Args:
+            samples: an array of samples, either (samples,) or
+                (samples, channels), as floats on [-1,1] or as signed or
+                unsigned integer PCM
+
+        Returns:
+            A (frames, num_motors) uint8 array, possibly with no rows
+        """
+        samples = np.asarray(samples)
+        if np.issubdtype(samples.dtype, np.integer):
+            info = np.iinfo(samples.dtype)
+            # unsigned PCM is centred on the middle of its range
+            offset = (float(info.max) + 1) / 2 if info.min == 0 else 0.0
+            scale = float(info.max) + 1 - offset
+            samples = (samples.astype(np.float32) - offset) / scale
+        if samples.ndim > 1:
+            samples = samples.mean(axis=1)
+        self._buffer = np.concatenate((self._buffer,
+            samples.astype(np.float32, copy=False)))
+
+        # frame k uses the window ending at sample round((k + 1) * hop)
+        available = self._buffer_start + len(self._buffer)
+        last_frame = int(available / self.hop) - 1
+        while int(round((last_frame + 2) * self.hop)) <= available:
+            last_frame += 1
+        if last_frame < self._next_frame:
+            return np.zeros((0, self.num_motors), dtype=np.uint8)
+        frame_numbers = np.arange(self._next_frame, last_frame + 1)
+        ends = np.rint((frame_numbers + 1) * self.hop).astype(np.intp)
+        starts = ends - self.window_size - self._buffer_start
+        windows = self._buffer[starts[:, None]
+            + np.arange(self.window_size)]
+        frames = self._compute_frames(windows)
+
+        self._next_frame = last_frame + 1
+        # keep only what the next window needs
+        next_start = (int(round((self._next_frame + 1) * self.hop))
+            - self.window_size)
+        drop = max(0, next_start - self._buffer_start)
+        self._buffer = self._buffer[drop:]
+        self._buffer_start += drop
+        return frames
+
+    def _compute_frames(self, windows):
+        spectra = np.fft.rfft(windows * self._window, axis=1)
+        power = spectra.real ** 2 + spectra.imag ** 2
+        band_power = power @ self._bands
+        db = 10 * np.log10(band_power / self._reference_power + 1e-12)
+        levels = (db - self.min_db) / (self.max_db - self.min_db)
+        return get_motor_intensities(levels, self.min_intensity,
+            self.max_intensity)
+
+    def frames(self, source, chunk_size=4096):
+        """Generate motor frames from an audio source, one frame (a uint8
+            array of num_motors values) at a time. The result can be
+            passed to NeoDevice.stream_frames or FrameScheduler.play.
+
+        Args:
+            source: a path to a WAV file, an array of samples, or an
+                iterable of sample arrays (chunks)
+
+            chunk_size: samples processed at a time when source is a file
+                or a single array
+
+        Returns:
+            A generator of frames
+        """
+        if isinstance(source, str) or hasattr(source, "__fspath__"):
+            chunks = read_wav(source, chunk_size)
+            sample_rate = next(chunks)
+            if sample_rate != self.sample_rate:
+                raise ValueError("WAV file sample rate is {} Hz, expected {}"
+                    .format(sample_rate, self.sample_rate))
+        elif isinstance(source, np.ndarray):
+            chunks = (source[i:i + chunk_size]
+                for i in range(0, len(source), chunk_size))
+        else:
+            chunks = source
+        for chunk in chunks:
+            for frame in self.process(chunk):
+                yield frame
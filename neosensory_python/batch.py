@@ -0,0 +1,200 @@
+"""Vectorized versions of the intensity and illusion helpers for computing
+many frames at once. Requires NumPy (pip install neosensory-python[numpy]).
+"""
+import functools
+import math
+
+import numpy as np
+
+# Number of points the exponential intensity curve is sampled at
+intensity_lut_size = 4096
+# Fraction of max_intensity below which soft saturation leaves mixed
+# values unchanged
+soft_saturation_knee = 0.75
+
+
+@functools.lru_cache(maxsize=32)
+def get_motor_intensity_lut(min_intensity, max_intensity,
+        lut_size=intensity_lut_size):
+    """Precompute the curve used by get_motor_intensity as a lookup table
+        sampled at lut_size evenly spaced points on [0,1].
+
+    Args:
+        min_intensity: a minimum motor intensity value.
+
+        max_intensity: a maximum motor intensity value.
+
+        lut_size: number of samples in the table
+
+    Returns:
+        A read-only uint8 array of lut_size motor intensity values
+    """
+    x = np.linspace(0.0, 1.0, lut_size)
+    lut = (np.expm1(x) / (math.e - 1) * (max_intensity - min_intensity)
+        + min_intensity).astype(np.uint8)
+    lut[-1] = max_intensity
+    lut.setflags(write=False)
+    return lut
+
+
+def get_motor_intensities(linear_intensities, min_intensity, max_intensity):
+    """Batch version of get_motor_intensity. Values are looked up in a
+        precomputed table, so results may differ from the scalar
+        version by at most one intensity step.
+
+    Args:
+        linear_intensities: an array of intensity values on [0,1]
+
+        min_intensity: a minimum motor intensity value.
+            Typically 0 or minimal perceptible motor activation value.
+
+        max_intensity: a maximum motor intensity value.
+            For Neosensory Buzz, motor values can be on [0,255]
+
+    Returns:
+        A uint8 array of the same shape as linear_intensities
+    """
+    lut = get_motor_intensity_lut(min_intensity, max_intensity)
+    x = np.asarray(linear_intensities, dtype=np.float64)
+    index = np.rint(np.clip(x, 0.0, 1.0) * (len(lut) - 1)).astype(np.intp)
+    return lut[index]
+
+
+def get_buzz_illusion_activations_batch(linear_intensities, locations,
+        min_intensity, max_intensity, num_motors):
+    """Batch version of get_buzz_illusion_activations. Computes one
+        illusory point per frame for many frames at once.
+
+    Args:
+        linear_intensities: an array of N intensity values on [0,1]
+
+        locations: an array of N locations around the wrist on [0,1]
+
+        min_intensity: a minimum motor intensity value.
+            Typically 0 or minimal perceptible motor activation value.
+
+        max_intensity: a maximum motor intensity value.
+            For Neosensory Buzz, motor values can be on [0,255]
+
+        num_motors: number of motors on the device (4 for Neosensory Buzz)
+
+    Returns:
+        A C-contiguous (N, num_motors) uint8 array of motor frames, which
+        can be passed directly to NeoDevice.stream_frames or, row by
+        row, to NeoDevice.vibrate_motors.
+    """
+    intensity = np.atleast_1d(np.asarray(linear_intensities,
+        dtype=np.float64))
+    location = np.atleast_1d(np.asarray(locations, dtype=np.float64))
+    intensity, location = np.broadcast_arrays(intensity, location)
+    intensity = intensity.ravel()
+    location = location.ravel()
+
+    frames = np.zeros((len(intensity), num_motors), dtype=np.uint8)
+    active = np.flatnonzero(intensity > 0)
+    if len(active) == 0:
+        return frames
+    motor_intensity = get_motor_intensities(intensity[active],
+        min_intensity, max_intensity).astype(np.float64)
+    motor_location = location[active] * (num_motors - 1)
+    lower_index = np.floor(motor_location).astype(np.intp)
+    upper_index = np.ceil(motor_location).astype(np.intp)
+    lower_activation = motor_intensity * np.sqrt(1 - (motor_location
+        - lower_index))
+    upper_activation = motor_intensity * np.sqrt(1 - (upper_index
+        - motor_location))
+    frames[active, lower_index] = lower_activation.astype(np.uint8)
+    frames[active, upper_index] = upper_activation.astype(np.uint8)
+    return frames
+
+
+def compose_illusion_sources(linear_intensities, locations, min_intensity,
+        max_intensity, num_motors, mix="sum", saturation="clip"):
+    """Render several illusory points per frame and mix them into one
+        frame. Each source is panned between its two nearest motors with
+        the same square root law as get_buzz_illusion_activations, and
+        all sources of all frames are rendered in one pass.
+
+    Args:
+        linear_intensities: an (N, S) array of intensity values on [0,1]
+            for S sources in each of N frames. Sources with intensity
+            <= 0 are silent, so unused slots can be left at 0. A 1-D
+            array holds the sources of a single frame.
+
+        locations: an (N, S) array of locations around the wrist on [0,1]
+
+        min_intensity: a minimum motor intensity value.
+            Typically 0 or minimal perceptible motor activation value.
+
+        max_intensity: a maximum motor intensity value.
+            For Neosensory Buzz, motor values can be on [0,255]
+
+        num_motors: number of motors on the device
+
+        mix: how sources landing on the same motor combine. "sum" adds
+            them, "max" keeps the strongest and "power" adds their squares
+            (constant power mixing).
+
+        saturation: how mixed values above max_intensity are limited.
+            "clip" cuts them off, "normalize" scales down every motor of
+            an overloaded frame by the same factor, and "soft" leaves
+            values below soft_saturation_knee * max_intensity unchanged
+            and compresses those above it smoothly with tanh, so they
+            approach max_intensity without a hard edge.
+
+    Returns:
+        A C-contiguous (N, num_motors) uint8 array of motor frames
+    """
+    intensity = np.asarray(linear_intensities, dtype=np.float64)
+    location = np.asarray(locations, dtype=np.float64)
+    intensity, location = np.broadcast_arrays(np.atleast_2d(intensity),
+        np.atleast_2d(location))
+    num_frames = intensity.shape[0]
+
+    # the exact curve of get_motor_intensity, so a single source renders
+    # like get_buzz_illusion_activations
+    level = np.floor(np.expm1(np.clip(intensity, 0.0, 1.0)) / (math.e - 1)
+        * (max_intensity - min_intensity) + min_intensity)
+    level[intensity >= 1] = max_intensity
+    level[intensity <= 0] = 0.0
+
+    motor_location = np.clip(location, 0.0, 1.0) * (num_motors - 1)
+    lower_index = np.floor(motor_location).astype(np.intp)
+    upper_index = np.ceil(motor_location).astype(np.intp)
+    lower_activation = level * np.sqrt(1 - (motor_location - lower_index))
+    # a source sitting exactly on a motor is rendered once
+    upper_activation = np.where(upper_index == lower_index, 0.0,
+        level * np.sqrt(1 - (upper_index - motor_location)))
+
+    # flat indices of each source's two motors in the output frames
+    frame_offset = (np.arange(num_frames) * num_motors)[:, None]
+    indices = np.concatenate(((lower_index + frame_offset).ravel(),
+        (upper_index + frame_offset).ravel()))
+    activations = np.concatenate((lower_activation.ravel(),
+        upper_activation.ravel()))
+    size = num_frames * num_motors
+    if mix == "sum":
+        mixed = np.bincount(indices, activations, size)
+    elif mix == "power":
+        mixed = np.sqrt(np.bincount(indices, activations ** 2, size))
+    elif mix == "max":
+        mixed = np.zeros(size)
+        np.maximum.at(mixed, indices, activations)
+    else:
+        raise ValueError("Unknown mix '{}'".format(mix))
+    mixed = mixed.reshape(num_frames, num_motors)
+
+    if saturation == "clip":
+        pass
+    elif saturation == "normalize":
+        peak = mixed.max(axis=1, keepdims=True)
+        mixed *= np.where(peak > max_intensity,
+            max_intensity / np.maximum(peak, 1e-12), 1.0)
+    elif saturation == "soft":
+        knee = soft_saturation_knee * max_intensity
+        headroom = max_intensity - knee
+        mixed = np.where(mixed > knee, knee + headroom
+            * np.tanh((mixed - knee) / headroom), mixed)
+    else:
+        raise ValueError("Unknown saturation '{}'".format(saturation))
+    return np.clip(mixed, 0, max_intensity).astype(np.uint8)
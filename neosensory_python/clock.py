@@ -0,0 +1,65 @@
+"""A shared clock that counts device frame ticks."""
+import asyncio
+import math
+import time
+
+from . import motor_frame_period
+
+
+class FrameClock:
+    """Maps frame tick numbers to absolute monotonic deadlines, so several
+        consumers can agree on when each frame is due.
+
+    """
+
+    def __init__(self, period=motor_frame_period):
+        self.period = period
+        self.start_time = None
+
+    def start(self, start_time=None):
+        """Set tick 0 to start_time, or to now if not given
+
+        Args:
+            start_time: a time.monotonic() timestamp
+        """
+        if start_time is None:
+            start_time = time.monotonic()
+        self.start_time = start_time
+
+    @property
+    def started(self):
+        return self.start_time is not None
+
+    def deadline(self, tick):
+        """Get the monotonic time a tick is due
+
+        Args:
+            tick: the tick number, counted from the start of the clock
+
+        Returns:
+            A time.monotonic() timestamp
+        """
+        return self.start_time + tick * self.period
+
+    def current_tick(self):
+        """Get the number of the most recent tick that is already due
+
+        Returns:
+            The tick number, negative before the clock's start time
+        """
+        return int(math.floor((time.monotonic() - self.start_time)
+            / self.period))
+
+    async def sleep_until(self, tick):
+        """Sleep until a tick is due. Returns at once if it already is.
+
+        Args:
+            tick: the tick number to wait for
+
+        Returns:
+            How late, in seconds, the tick was reached
+        """
+        delay = self.deadline(tick) - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return time.monotonic() - self.deadline(tick)
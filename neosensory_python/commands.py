@@ -0,0 +1,203 @@
+"""The per-device queue that every write to a NeoDevice goes through."""
+import asyncio
+import collections
+
+# Priority classes, most urgent first
+priority_control = 0
+priority_command = 1
+priority_frames = 2
+
+
+class _Entry:
+    __slots__ = ("payload", "num_frames", "raw_frames", "coalesce", "future")
+
+    def __init__(self, payload, num_frames, raw_frames, coalesce, future):
+        self.payload = payload
+        self.num_frames = num_frames
+        self.raw_frames = raw_frames
+        self.coalesce = coalesce
+        self.future = future
+
+
+def _resolve(entry, exception=None):
+    if entry.future.done():
+        # the caller stopped waiting
+        return
+    if exception is None:
+        entry.future.set_result(None)
+    else:
+        entry.future.set_exception(exception)
+
+
+class CommandQueue:
+    """Serializes the writes of one NeoDevice. Writes are sent in priority
+        order (control commands such as stopping the motors, then other
+        commands, then motor frames) and in submission order within a
+        priority. Motor frames waiting next to each other are merged into
+        one write where the MTU allows, a single frame that repeats the
+        frame the device is already holding is skipped, and control
+        commands can drop frames that have not been sent yet.
+
+    Args:
+        device: the NeoDevice whose writes are queued
+    """
+
+    def __init__(self, device):
+        self.device = device
+        self._queues = tuple(collections.deque() for _ in range(3))
+        self._worker = None
+        # the last frame the device was sent, valid while _holding
+        self._last_frame = bytearray()
+        self._holding = False
+        # frames skipped as repeats of the frame the device is holding
+        self.coalesced_frames = 0
+        # frames dropped by preempt() before they were sent
+        self.preempted_frames = 0
+        # writes saved by merging frames into one write
+        self.merged_writes = 0
+
+    def __len__(self):
+        return sum(len(queue) for queue in self._queues)
+
+    def submit(self, payload, priority=priority_command, num_frames=0,
+            raw_frames=False, coalesce=False):
+        """Queue a write
+
+        Args:
+            payload: the bytes to write. If raw_frames is True, these are
+                motor intensities, encoded as motors vibrate when sent,
+                and must not be changed until then (write copies them).
+
+            priority: priority_control, priority_command or priority_frames
+
+            num_frames: number of motor frames the write carries
+
+            raw_frames: whether payload is unencoded motor frames that may
+                be merged with neighbouring frames
+
+            coalesce: whether a single frame may be skipped if it repeats
+                the frame the device is holding
+
+        Returns:
+            A future resolved once the write has been made (or skipped)
+        """
+        future = asyncio.get_event_loop().create_future()
+        self._queues[priority].append(_Entry(payload, num_frames, raw_frames,
+            coalesce, future))
+        if self._worker is None:
+            self._worker = asyncio.ensure_future(self._run())
+        return future
+
+    async def write(self, payload, priority=priority_command, num_frames=0,
+            raw_frames=False, coalesce=False):
+        """Queue a write and wait until it has been made (or skipped).
+            Takes the same arguments as submit. When nothing else is
+            queued or being sent, the write is made directly without
+            handing it to the worker task, and without copying raw
+            frames, which are encoded before the write is awaited.
+        """
+        if self._worker is not None:
+            if raw_frames:
+                payload = bytes(payload)
+            await self.submit(payload, priority, num_frames, raw_frames,
+                coalesce)
+            return
+        # anything submitted meanwhile waits for the worker started below
+        self._worker = True
+        try:
+            await self._send(payload, num_frames, raw_frames, coalesce,
+                priority)
+        finally:
+            self._worker = None
+            if len(self):
+                self._worker = asyncio.ensure_future(self._run())
+
+    def forget_held_frame(self):
+        """Stop assuming the device holds the last frame sent, so the
+            next frame is sent even if it repeats it. Called whenever the
+            device's motors or link may have changed under the queue.
+        """
+        self._holding = False
+
+    def preempt(self):
+        """Drop every motor frame write that has not been sent yet. Their
+            futures resolve as if they had been sent.
+        """
+        self._holding = False
+        frames = self._queues[priority_frames]
+        while frames:
+            entry = frames.popleft()
+            self.preempted_frames += entry.num_frames
+            if self.device.metrics is not None:
+                self.device.metrics.dropped_frames += entry.num_frames
+            _resolve(entry)
+
+    def _next_entry(self):
+        for priority, queue in enumerate(self._queues):
+            if queue:
+                return priority, queue.popleft()
+        return None, None
+
+    async def _run(self):
+        try:
+            while True:
+                priority, entry = self._next_entry()
+                if entry is None:
+                    break
+                entries = [entry]
+                try:
+                    await self._send(entry.payload, entry.num_frames,
+                        entry.raw_frames, entry.coalesce, priority, entries)
+                except Exception as e:
+                    for sent in entries:
+                        _resolve(sent, e)
+                else:
+                    for sent in entries:
+                        _resolve(sent)
+        finally:
+            self._worker = None
+
+    async def _send(self, data, num_frames, raw_frames, coalesce, priority,
+            entries=None):
+        # entries collects the queued entries merged into this write
+        device = self.device
+        if not raw_frames:
+            # a command such as motors clear_queue or motors stop may
+            # change what the motors hold
+            self._holding = False
+            await device._transmit(data, num_frames)
+            return
+        view = memoryview(data)
+        if not view.c_contiguous:
+            view = memoryview(view.tobytes())
+        elif view.ndim != 1 or view.format != "B":
+            view = view.cast("B")
+        frame_size = len(view) // max(1, num_frames)
+        if (coalesce and num_frames == 1 and self._holding
+                and view == self._last_frame
+                and device.estimate_queue_depth() <= 1):
+            # the device is on (or about to play) its last frame and
+            # holds it, so this changes nothing
+            self.coalesced_frames += 1
+            return
+        if entries is not None:
+            frames = self._queues[priority_frames]
+            if priority == priority_frames and frames and frames[0].raw_frames:
+                max_frames = device.get_max_frames_per_write(frame_size)
+                merged_data = bytearray(view)
+                while (frames and frames[0].raw_frames
+                        and num_frames + frames[0].num_frames <= max_frames
+                        and len(frames[0].payload) == frame_size
+                        * frames[0].num_frames):
+                    merged = frames.popleft()
+                    entries.append(merged)
+                    merged_data += merged.payload
+                    num_frames += merged.num_frames
+                self.merged_writes += len(entries) - 1
+                view = memoryview(merged_data)
+        payload = device._encoder.encode(view)
+        # until the write succeeds, the device may hold anything
+        self._holding = False
+        await device._transmit(payload, num_frames, view)
+        self._last_frame[:] = view[len(view) - frame_size:]
+        self._holding = True
@@ -0,0 +1,335 @@
+"""Connecting to a Neosensory device quickly and keeping it connected:
+known device addresses are cached so later runs connect without a full
+scan, the developer session is set up in one round trip, and dropped
+connections are re-established with their session state restored.
+"""
+import asyncio
+import json
+import os
+
+from bleak import BleakClient, BleakScanner
+from bleak.exc import BleakError
+
+from . import NeoDevice, default_response_timeout
+
+# Where DeviceCache keeps device addresses unless told otherwise
+default_cache_path = os.path.join(os.path.expanduser("~"), ".neosensory",
+    "devices.json")
+# Errors that mean a connection attempt failed and may be retried
+_connect_errors = (BleakError, asyncio.TimeoutError, OSError)
+
+
+class DeviceCache:
+    """Remembers the devices connected to before, most recently used
+        first, in a small JSON file.
+
+    Args:
+        path: the cache file
+
+        max_devices: number of devices remembered
+    """
+
+    def __init__(self, path=default_cache_path, max_devices=8):
+        self.path = path
+        self.max_devices = max_devices
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                devices = json.load(f)
+        except (OSError, ValueError):
+            return []
+        if not isinstance(devices, list):
+            return []
+        return [device for device in devices
+            if isinstance(device, dict) and "address" in device]
+
+    def _save(self, devices):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # write a new file and move it into place, so a crash cannot
+        # leave a half written cache behind
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w") as f:
+            json.dump(devices, f, indent=1)
+        os.replace(temporary_path, self.path)
+
+    def addresses(self, name=None):
+        """Get the addresses of known devices
+
+        Args:
+            name: if given, only devices whose name contains it, or
+                whose name is unknown
+
+        Returns:
+            A list of addresses, most recently used first
+        """
+        return [device["address"] for device in self._load()
+            if name is None or device.get("name") is None
+            or name in device["name"]]
+
+    def remember(self, address, name=None):
+        """Record a device as the most recently used
+
+        Args:
+            address: the device address
+
+            name: the device name, or None to keep the name it was
+                remembered with before
+        """
+        devices = []
+        for device in self._load():
+            if device["address"] != address:
+                devices.append(device)
+            elif name is None:
+                name = device.get("name")
+        devices.insert(0, {"address": address, "name": name})
+        self._save(devices[:self.max_devices])
+
+    def forget(self, address):
+        """Remove a device from the cache
+
+        Args:
+            address: the device address
+        """
+        devices = self._load()
+        remaining = [device for device in devices
+            if device["address"] != address]
+        if len(remaining) != len(devices):
+            self._save(remaining)
+
+
+class NeoConnection:
+    """Connects to a Neosensory device and keeps it connected. The most
+        recently used cached address is tried first. If it fails, a scan
+        runs while the other cached addresses are tried, and whichever
+        finds the device first wins. Once connected, notifications are
+        enabled and the developer session is set up with
+        NeoDevice.start_developer_session. If the connection drops, it is
+        re-established in the background and the session restored with
+        NeoDevice.restore_session, keeping the same NeoDevice.
+
+        Use it as an async context manager, e.g.
+        async with NeoConnection() as my_buzz: ...
+
+    Args:
+        address: the device to connect to, or None for the most recently
+            used device whose name contains name
+
+        name: part of the name of the devices to look for
+
+        cache_path: the DeviceCache file, or None to not cache addresses
+
+        authorize: whether to start a developer session on connecting
+
+        pause_algorithm: whether the session also pauses the device
+            algorithm to accept motor frames
+
+        notification_handler: the handler function passed to
+            NeoDevice.enable_notifications
+
+        reconnect: whether to reconnect automatically after a drop
+
+        connect_timeout: seconds allowed for each connection attempt
+
+        scan_timeout: seconds to scan for a device before giving up
+
+        max_retry_delay: longest wait in seconds between reconnection
+            attempts. Attempts start quickly and back off up to this.
+
+        client_factory: a function taking an address (or a device found
+            by scanning) and a disconnected_callback keyword argument and
+            returning a client, e.g. SimulatedBuzzClient for testing
+    """
+
+    def __init__(self, address=None, name="Buzz",
+            cache_path=default_cache_path, authorize=True,
+            pause_algorithm=True, notification_handler=None, reconnect=True,
+            connect_timeout=5.0, scan_timeout=10.0, max_retry_delay=5.0,
+            client_factory=BleakClient):
+        self.address = address
+        self.name = name
+        self.cache = None if cache_path is None else DeviceCache(cache_path)
+        self.authorize = authorize
+        self.pause_algorithm = pause_algorithm
+        self.notification_handler = notification_handler
+        self.reconnect = reconnect
+        self.connect_timeout = connect_timeout
+        self.scan_timeout = scan_timeout
+        self.max_retry_delay = max_retry_delay
+        self.client_factory = client_factory
+        self.client = None
+        self.device = None
+        # number of times the connection was re-established after a drop
+        self.reconnects = 0
+        # made on first use in the event loop, as an Event binds to the
+        # loop current when it is made on Python < 3.10
+        self._connected = None
+        self._closing = False
+        self._reconnect_task = None
+
+    @property
+    def is_connected(self):
+        return self._connected is not None and self._connected.is_set()
+
+    def _get_connected_event(self):
+        if self._connected is None:
+            self._connected = asyncio.Event()
+        return self._connected
+
+    async def wait_connected(self, timeout=None):
+        """Wait until the device is connected and its session is set up,
+            e.g. while a dropped connection is being re-established
+
+        Args:
+            timeout: seconds to wait before raising asyncio.TimeoutError,
+                or None to wait indefinitely
+        """
+        await asyncio.wait_for(self._get_connected_event().wait(), timeout)
+
+    async def connect(self):
+        """Connect to the device and set up its session
+
+        Returns:
+            The connected NeoDevice
+
+        Raises:
+            ConnectionError: if no device could be found and connected to
+        """
+        self._closing = False
+        candidates = []
+        if self.address is not None:
+            candidates.append(self.address)
+        elif self.cache is not None:
+            candidates += self.cache.addresses(self.name)
+        client = None
+        name = None
+        scan = None
+        try:
+            for address in candidates:
+                attempt = asyncio.ensure_future(self._try_connect(address))
+                if scan is not None and not scan.done():
+                    await asyncio.wait([attempt, scan],
+                        return_when=asyncio.FIRST_COMPLETED)
+                if (scan is not None and scan.done() and not attempt.done()
+                        and scan.result() is not None):
+                    # the scan found the device first
+                    attempt.cancel()
+                    await asyncio.wait([attempt])
+                    break
+                client = await attempt
+                if client is not None:
+                    break
+                if scan is None:
+                    # the cache may be stale, so look for the device
+                    # while the remaining addresses are tried
+                    scan = asyncio.ensure_future(self._scan())
+            if client is None:
+                if scan is None:
+                    scan = asyncio.ensure_future(self._scan())
+                found = await scan
+                if found is not None:
+                    client = await self._try_connect(found)
+                    name = found.name
+        finally:
+            if scan is not None and not scan.done():
+                scan.cancel()
+        if client is None:
+            raise ConnectionError("No {} could be connected to".format(
+                self.address or self.name))
+        self.client = client
+        await self._set_up(restore=False)
+        if self.cache is not None:
+            self.cache.remember(self.address, name)
+        return self.device
+
+    async def disconnect(self):
+        """Disconnect from the device without reconnecting"""
+        self._closing = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        if self._connected is not None:
+            self._connected.clear()
+        if self.client is not None:
+            await self.client.disconnect()
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.disconnect()
+
+    async def _try_connect(self, target):
+        # target is an address, or a device found by scanning
+        client = self.client_factory(target,
+            disconnected_callback=self._handle_disconnect)
+        try:
+            await asyncio.wait_for(client.connect(), self.connect_timeout)
+        except _connect_errors:
+            await self._discard(client)
+            return None
+        except asyncio.CancelledError:
+            await self._discard(client)
+            raise
+        self.address = getattr(target, "address", target)
+        return client
+
+    async def _discard(self, client):
+        # release a client whose connection attempt failed
+        try:
+            await client.disconnect()
+        except _connect_errors:
+            pass
+
+    async def _scan(self):
+        if self.address is not None:
+            def matches(device, advertisement_data):
+                return device.address == self.address
+        else:
+            def matches(device, advertisement_data):
+                return self.name in (device.name or "")
+        try:
+            # stops as soon as a matching device is seen
+            return await BleakScanner.find_device_by_filter(matches,
+                timeout=self.scan_timeout)
+        except _connect_errors:
+            return None
+
+    async def _set_up(self, restore):
+        if self.device is None:
+            self.device = NeoDevice(self.client)
+        else:
+            self.device.set_client(self.client)
+        await self.device.enable_notifications(self.notification_handler)
+        if restore:
+            await self.device.restore_session(default_response_timeout)
+        elif self.authorize:
+            await self.device.start_developer_session(self.pause_algorithm)
+        self._get_connected_event().set()
+
+    def _handle_disconnect(self, client):
+        if client is not self.client or not self.is_connected:
+            return
+        self._connected.clear()
+        if self.device is not None:
+            # frames not sent yet would play late, if at all
+            self.device.commands.preempt()
+        if self.reconnect and not self._closing:
+            self._reconnect_task = asyncio.ensure_future(self._reconnect())
+
+    async def _reconnect(self):
+        delay = 0.1
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self.client.connect(),
+                    self.connect_timeout)
+                await self._set_up(restore=True)
+            except _connect_errors + (RuntimeError,):
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+                continue
+            self.reconnects += 1
+            break
+        self._reconnect_task = None
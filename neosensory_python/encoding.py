@@ -0,0 +1,100 @@
+"""Pre-encoded CLI commands and a reusable encoder for motors vibrate
+payloads.
+"""
+import base64
+import binascii
+
+# Fixed CLI commands, encoded once at import time
+auth_as_developer_command = b"auth as developer\r\n"
+accept_command = b"accept\r\n"
+audio_start_command = b"audio start\r\n"
+audio_stop_command = b"audio stop\r\n"
+device_battery_soc_command = b"device battery_soc\r\n"
+device_info_command = b"device info\r\n"
+motors_clear_queue_command = b"motors clear_queue\r\n"
+motors_start_command = b"motors start\r\n"
+motors_stop_command = b"motors stop\r\n"
+
+_vibrate_prefix = b'motors vibrate "'
+_vibrate_suffix = b'"\r\n'
+# Bytes taken up by 'motors vibrate ""\r\n' around the base64 payload
+vibrate_command_overhead = len(_vibrate_prefix) + len(_vibrate_suffix)
+
+
+def get_vibrate_command_length(num_bytes):
+    """Get the length of a motors vibrate command carrying num_bytes of
+        motor data.
+
+    Args:
+        num_bytes: number of motor intensity bytes in the command
+
+    Returns:
+        The encoded command length in bytes
+    """
+    return vibrate_command_overhead + (num_bytes + 2) // 3 * 4
+
+
+def decode_vibrate_command(command):
+    """Get the motor intensities carried by a motors vibrate command
+
+    Args:
+        command: the encoded command
+
+    Returns:
+        The motor intensities as bytes
+    """
+    command = bytes(command)
+    start = command.index(b'"') + 1
+    return base64.b64decode(command[start:command.index(b'"', start)])
+
+
+class MotorCommandEncoder:
+    """Encodes motor frames into motors vibrate commands inside a
+        preallocated buffer, so streaming does not build a new command
+        string per frame.
+
+    """
+
+    def __init__(self, max_bytes=256):
+        self._buffer = self._allocate(get_vibrate_command_length(max_bytes))
+
+    @staticmethod
+    def _allocate(length):
+        buffer = bytearray(length)
+        buffer[:len(_vibrate_prefix)] = _vibrate_prefix
+        return buffer
+
+    def encode(self, frame_data):
+        """Encode motor intensities as a motors vibrate command.
+
+        Args:
+            frame_data: motor intensity values on [0,255], either a list
+                or any object supporting the buffer protocol with a
+                one-byte item size (bytes, memoryview, numpy uint8 array)
+
+        Returns:
+            A memoryview of the encoded command. It is only valid until
+            the next call to encode, so write it out before then.
+        """
+        if type(frame_data) not in (bytes, bytearray):
+            try:
+                view = memoryview(frame_data)
+            except TypeError:
+                frame_data = bytes(frame_data)
+            else:
+                if view.itemsize != 1:
+                    raise ValueError("Motor data must be one byte per "
+                        "value, got an item size of {}".format(view.itemsize))
+                # strided views, e.g. array slices, are copied into order
+                frame_data = view if view.c_contiguous else view.tobytes()
+        encoded = binascii.b2a_base64(frame_data, newline=False)
+        end = len(_vibrate_prefix) + len(encoded)
+        length = end + len(_vibrate_suffix)
+        if length > len(self._buffer):
+            # views handed out earlier keep the old buffer alive, so
+            # replace it rather than resizing in place
+            self._buffer = self._allocate(length)
+        buffer = self._buffer
+        buffer[len(_vibrate_prefix):end] = encoded
+        buffer[end:length] = _vibrate_suffix
+        return memoryview(buffer)[:length]
@@ -0,0 +1,237 @@
+"""Upsampling sparse, timestamped control keyframes to motor frames on the
+device's 16 ms tick. Requires NumPy (pip install
+neosensory-python[numpy]).
+"""
+import collections
+import math
+
+import numpy as np
+
+from . import motor_frame_period
+from .batch import get_buzz_illusion_activations_batch, get_motor_intensities
+
+# Supported interpolation modes
+interpolation_modes = ("linear", "cubic", "perceptual")
+
+
+class KeyframeInterpolator:
+    """Turns keyframes arriving at any (possibly irregular) rate into one
+        frame per device tick. Keyframes are either motor values, one per
+        motor, or illusion (intensity, location) pairs rendered like
+        get_buzz_illusion_activations. Frames are computed as soon as the
+        keyframes they depend on have arrived: up to the latest keyframe
+        for linear and perceptual interpolation, and up to the one before
+        it for cubic interpolation. Only the last four keyframes are kept,
+        so memory stays flat however long the input runs. Several devices
+        can be driven from one interpolator, with every device's frames
+        computed together.
+
+        In "linear" mode motor values change at a steady rate between
+        keyframes. In "cubic" mode they follow a smooth curve through
+        the keyframes (a Catmull-Rom spline with tangents scaled to the
+        time between keyframes). In "perceptual" mode they change at a
+        steady rate on the linear intensity scale of get_motor_intensity,
+        so fades feel even. For illusion keyframes, whose intensities are
+        already on that scale, perceptual is the same as linear.
+
+    Args:
+        num_motors: number of motors on each device
+
+        num_devices: number of devices, or None for a single device. With
+            several devices, keyframe values have a leading device axis
+            and frames are (num_devices, num_motors) arrays.
+
+        mode: "linear", "cubic" or "perceptual"
+
+        illusion: whether keyframes are (intensity, location) pairs, each
+            on [0,1], rather than motor values on [0,255]
+
+        min_intensity: a minimum motor intensity value
+
+        max_intensity: a maximum motor intensity value
+
+        frame_period: seconds between frames
+    """
+
+    def __init__(self, num_motors=4, num_devices=None, mode="linear",
+            illusion=False, min_intensity=0, max_intensity=255,
+            frame_period=motor_frame_period):
+        if mode not in interpolation_modes:
+            raise ValueError("Unknown interpolation mode '{}'".format(mode))
+        self.num_motors = num_motors
+        self.num_devices = num_devices
+        self.mode = mode
+        self.illusion = illusion
+        self.min_intensity = min_intensity
+        self.max_intensity = max_intensity
+        self.frame_period = frame_period
+        self._channels = 2 if illusion else num_motors
+        self.reset()
+
+    def reset(self):
+        """Forget all keyframes. The next keyframe starts a new timeline."""
+        # (time, values) of the most recent keyframes
+        self._keyframes = collections.deque(maxlen=4)
+        # time of tick 0, and the next tick to compute
+        self._origin = None
+        self._next_tick = 0
+
+    def add(self, time, values):
+        """Add a keyframe and compute the frames it completes
+
+        Args:
+            time: the keyframe's time in seconds, on any clock, later
+                than the previous keyframe
+
+            values: num_motors motor values, or an (intensity, location)
+                pair for illusion keyframes. With several devices, an
+                array with one row of these per device.
+
+        Returns:
+            A uint8 array of frames, one row per tick, possibly with no
+            rows. Each frame is num_motors values, or (num_devices,
+            num_motors) values for several devices.
+        """
+        values = self._to_internal(values)
+        keyframes = self._keyframes
+        if keyframes and time <= keyframes[-1][0]:
+            raise ValueError("Keyframe at {} s is not after the previous "
+                "one at {} s".format(time, keyframes[-1][0]))
+        if self._origin is None:
+            self._origin = time
+        keyframes.append((time, values))
+        if self.mode != "cubic":
+            if len(keyframes) < 2:
+                return self._no_frames()
+            return self._segment(keyframes[-2], keyframes[-2],
+                keyframes[-1], keyframes[-1], keyframes[-1][0], False)
+        if len(keyframes) < 3:
+            return self._no_frames()
+        before = keyframes[-4] if len(keyframes) == 4 else keyframes[-3]
+        return self._segment(before, keyframes[-3], keyframes[-2],
+            keyframes[-1], keyframes[-2][0], False)
+
+    def flush(self):
+        """Compute the remaining frames up to and including the last
+            keyframe, as if it were the final one, and start over. The
+            final frame always has the last keyframe's values.
+
+        Returns:
+            A uint8 array of frames, like add
+        """
+        keyframes = self._keyframes
+        if not keyframes:
+            return self._no_frames()
+        last = keyframes[-1]
+        if len(keyframes) == 1:
+            frames = self._segment(last, last, last, last, last[0], True)
+        elif self.mode != "cubic":
+            frames = self._segment(keyframes[-2], keyframes[-2], last, last,
+                last[0], True)
+        else:
+            before = keyframes[-3] if len(keyframes) >= 3 else keyframes[-2]
+            frames = self._segment(before, keyframes[-2], last, last,
+                last[0], True)
+        if (self._origin + (self._next_tick - 1) * self.frame_period
+                < last[0] - 1e-9):
+            # the last tick fell short of the final keyframe, so end on
+            # its values rather than leave the motors holding a frame
+            # from on the way there
+            frames = np.concatenate([frames, self._render(last[1][None])])
+        self.reset()
+        return frames
+
+    def frames(self, keyframes):
+        """Generate frames from keyframes, one frame per tick. The result
+            can be passed to NeoDevice.stream_frames (or, for several
+            devices, NeoDevicePool.stream_frames).
+
+        Args:
+            keyframes: an iterable of (time, values) pairs, as taken by
+                add
+
+        Returns:
+            A generator of frames
+        """
+        for time, values in keyframes:
+            for frame in self.add(time, values):
+                yield frame
+        for frame in self.flush():
+            yield frame
+
+    def _to_internal(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        shape = (self._channels,) if self.num_devices is None else \
+            (self.num_devices, self._channels)
+        if values.shape != shape:
+            raise ValueError("Expected keyframe values of shape {}, got {}"
+                .format(shape, values.shape))
+        values = values.reshape(-1, self._channels)
+        if self.mode == "perceptual" and not self.illusion:
+            # interpolate on the linear intensity scale, the inverse of
+            # the get_motor_intensity curve
+            span = max(1, self.max_intensity - self.min_intensity)
+            level = np.clip((values - self.min_intensity) / span, 0.0, 1.0)
+            values = np.log1p(level * (math.e - 1))
+        return values
+
+    def _no_frames(self):
+        return self._render(np.zeros((0,) + self._keyframes[-1][1].shape))
+
+    def _segment(self, before, start, end, after, stop, inclusive):
+        # frames for the ticks from the next one up to stop, on the
+        # segment from start to end, with the keyframes before and after
+        # it shaping cubic curves
+        period = self.frame_period
+        position = (stop - self._origin) / period
+        if inclusive:
+            last_tick = int(math.floor(position + 1e-9)) + 1
+        else:
+            last_tick = int(math.ceil(position - 1e-9))
+        ticks = np.arange(self._next_tick, max(self._next_tick, last_tick))
+        self._next_tick += len(ticks)
+        time_start, values_start = start
+        time_end, values_end = end
+        duration = time_end - time_start
+        if duration <= 0:
+            return self._render(np.broadcast_to(values_end,
+                (len(ticks),) + values_end.shape))
+        u = ((self._origin + ticks * period - time_start)
+            / duration)[:, None, None]
+        if self.mode != "cubic":
+            values = values_start + u * (values_end - values_start)
+        else:
+            # Hermite curve with Catmull-Rom tangents, scaled for
+            # keyframes that are not evenly spaced in time
+            time_before, values_before = before
+            time_after, values_after = after
+            tangent_start = ((values_end - values_before)
+                * duration / max(time_end - time_before, 1e-9))
+            tangent_end = ((values_after - values_start)
+                * duration / max(time_after - time_start, 1e-9))
+            u2 = u * u
+            u3 = u2 * u
+            values = ((2 * u3 - 3 * u2 + 1) * values_start
+                + (u3 - 2 * u2 + u) * tangent_start
+                + (-2 * u3 + 3 * u2) * values_end
+                + (u3 - u2) * tangent_end)
+        return self._render(values)
+
+    def _render(self, values):
+        # values is (ticks, devices, channels) in the interpolation space
+        num_frames, num_devices = values.shape[:2]
+        if self.illusion:
+            values = np.clip(values, 0.0, 1.0).reshape(-1, 2)
+            frames = get_buzz_illusion_activations_batch(values[:, 0],
+                values[:, 1], self.min_intensity, self.max_intensity,
+                self.num_motors)
+        elif self.mode == "perceptual":
+            frames = np.where(values > 0, get_motor_intensities(values,
+                self.min_intensity, self.max_intensity), 0).astype(np.uint8)
+        else:
+            frames = np.clip(np.rint(values), 0,
+                self.max_intensity).astype(np.uint8)
+        frames = frames.reshape(num_frames, num_devices, self.num_motors)
+        if self.num_devices is None:
+            frames = frames[:, 0]
+        return np.ascontiguousarray(frames)
@@ -0,0 +1,162 @@
+"""Opt-in instrumentation of the writes a NeoDevice makes."""
+import bisect
+import time
+
+# Upper bounds (in seconds) of the latency histogram buckets. A final
+# bucket catches everything slower.
+latency_buckets = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1,
+    0.2, 0.5, 1.0, 2.0)
+
+
+class LatencyHistogram:
+    """Counts latencies into fixed buckets, keeping the total and maximum.
+
+    Args:
+        buckets: increasing bucket upper bounds in seconds
+    """
+
+    def __init__(self, buckets=latency_buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        """Add one latency
+
+        Args:
+            seconds: the latency in seconds
+        """
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def snapshot(self):
+        """Get the histogram as plain data
+
+        Returns:
+            A dict with the bucket bounds, counts, and count, mean and max
+            latency in seconds
+        """
+        return {
+            "buckets": list(self.buckets),
+            "counts": list(self.counts),
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+        }
+
+
+def get_command_kind(payload):
+    """Get the command a write carries, e.g. "motors vibrate", from up to
+        its first three words, leaving out quoted arguments.
+
+    Args:
+        payload: the bytes written to the device
+
+    Returns:
+        The command name as a str
+    """
+    words = bytes(payload[:32]).split(b'"', 1)[0].split()
+    return b" ".join(words[:3]).decode("utf-8", errors="replace")
+
+
+class DeviceMetrics:
+    """Latency histograms per command, write and frame counters, and the
+        estimated device queue depth for one NeoDevice. Enable with
+        NeoDevice.enable_metrics. Frames written after the device's motor
+        queue had run dry are counted in late_frames.
+
+    Args:
+        exporter: a function called with snapshot() results
+
+        export_interval: if given, exporter is called automatically at
+            most this often (in seconds) as writes are recorded.
+            Otherwise call export() when a snapshot is wanted.
+    """
+
+    def __init__(self, exporter=None, export_interval=None):
+        self.exporter = exporter
+        self.export_interval = export_interval
+        self.reset()
+
+    def reset(self):
+        """Zero all counters and histograms"""
+        self.latencies = {}
+        self.writes = 0
+        self.bytes_written = 0
+        self.frames_written = 0
+        self.late_frames = 0
+        self.dropped_frames = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.started = time.monotonic()
+        self._last_export = self.started
+
+    def record_write(self, payload, seconds, num_frames=0):
+        """Record a completed write
+
+        Args:
+            payload: the bytes written
+
+            seconds: how long the write took
+
+            num_frames: the number of motor frames it carried
+        """
+        kind = get_command_kind(payload)
+        histogram = self.latencies.get(kind)
+        if histogram is None:
+            histogram = self.latencies[kind] = LatencyHistogram()
+        histogram.record(seconds)
+        self.writes += 1
+        self.bytes_written += len(payload)
+        self.frames_written += num_frames
+        if (self.exporter is not None and self.export_interval is not None
+                and time.monotonic() - self._last_export
+                >= self.export_interval):
+            self.export()
+
+    def record_queue_depth(self, depth):
+        """Record the estimated number of frames in the device queue
+
+        Args:
+            depth: the estimated queue depth in frames
+        """
+        self.queue_depth = depth
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+
+    def snapshot(self):
+        """Get the current metrics as plain data, e.g. for JSON export
+
+        Returns:
+            A dict of all counters and per-command latency histograms
+        """
+        return {
+            "time": time.time(),
+            "elapsed": time.monotonic() - self.started,
+            "writes": self.writes,
+            "bytes_written": self.bytes_written,
+            "frames_written": self.frames_written,
+            "late_frames": self.late_frames,
+            "dropped_frames": self.dropped_frames,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "latencies": {kind: histogram.snapshot()
+                for kind, histogram in self.latencies.items()},
+        }
+
+    def export(self):
+        """Send a snapshot to the exporter, if there is one
+
+        Returns:
+            The snapshot
+        """
+        self._last_export = time.monotonic()
+        snapshot = self.snapshot()
+        if self.exporter is not None:
+            self.exporter(snapshot)
+        return snapshot
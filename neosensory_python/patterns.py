@@ -0,0 +1,340 @@
+"""Haptic patterns compiled ahead of time into ready-to-send motors vibrate
+writes, with an LRU cache that can be backed by memory-mapped files.
+"""
+import array
+import collections
+import hashlib
+import mmap
+import os
+import struct
+import sys
+
+from . import get_buzz_illusion_activations, motor_queue_size
+from .encoding import MotorCommandEncoder
+
+# Identifies a compiled pattern file
+pattern_file_magic = b"NEOP"
+pattern_file_version = 1
+# Frames packed into each write unless told otherwise: half the device
+# motor queue, so a write can go out while the device still has frames
+default_frames_per_write = motor_queue_size // 2
+# magic, version, num_motors, reserved, number of writes
+_header = struct.Struct("<4sBBHI")
+
+
+def _argument_key(value):
+    # a cache key part that identifies a pattern argument by its contents
+    if isinstance(value, (list, tuple)):
+        return "{}({})".format(type(value).__name__,
+            ",".join(_argument_key(item) for item in value))
+    if isinstance(value, dict):
+        return "dict({})".format(",".join("{!r}:{}".format(name,
+            _argument_key(item)) for name, item in sorted(value.items())))
+    if hasattr(value, "dtype") and hasattr(value, "tobytes"):
+        # array reprs are truncated, so hash the values
+        return "array({},{},{})".format(value.dtype.str, value.shape,
+            hashlib.sha1(value.tobytes()).hexdigest())
+    return repr(value)
+
+
+def _little_endian(values):
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+class CompiledPattern:
+    """A pattern as a sequence of pre-encoded motors vibrate writes. Play
+        one with NeoDevice.play_pattern.
+
+    Args:
+        payload: bytes-like object holding every write back to back
+
+        offsets: array of the start of each write in payload, followed by
+            the end of the last one
+
+        frame_counts: array of the number of frames in each write
+
+        num_motors: number of motors each frame is for
+    """
+
+    def __init__(self, payload, offsets, frame_counts, num_motors=4):
+        self.payload = payload
+        self.offsets = offsets
+        self.frame_counts = frame_counts
+        self.num_motors = num_motors
+        self._mmap = None
+
+    def __len__(self):
+        return len(self.frame_counts)
+
+    @property
+    def num_frames(self):
+        return sum(self.frame_counts)
+
+    @property
+    def max_write_length(self):
+        return max((self.offsets[i + 1] - self.offsets[i]
+            for i in range(len(self))), default=0)
+
+    def writes(self):
+        """Iterate over the writes
+
+        Returns:
+            A generator of (command, num_frames) pairs, where command is a
+            memoryview into the payload
+        """
+        view = memoryview(self.payload)
+        offsets = self.offsets
+        for i, num_frames in enumerate(self.frame_counts):
+            yield view[offsets[i]:offsets[i + 1]], num_frames
+
+    def save(self, path):
+        """Write the pattern to a file that load() can memory-map. The
+            file is written under a temporary name and moved into place,
+            so a partly written pattern file is never left behind.
+
+        Args:
+            path: the file to write
+        """
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(_header.pack(pattern_file_magic, pattern_file_version,
+                self.num_motors, 0, len(self)))
+            f.write(_little_endian(array.array("I", self.offsets)).tobytes())
+            f.write(_little_endian(array.array("H", self.frame_counts))
+                .tobytes())
+            f.write(memoryview(self.payload)[:self.offsets[-1]])
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Memory-map a pattern written by save(). The writes are sent
+            straight from the mapped file without copying.
+
+        Args:
+            path: the file to load
+
+        Returns:
+            A CompiledPattern
+        """
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mapped) < _header.size:
+            mapped.close()
+            raise ValueError("{} is not a compiled pattern file".format(path))
+        magic, version, num_motors, _, num_writes = _header.unpack_from(
+            mapped)
+        position = _header.size + 6 * num_writes + 4
+        if (magic != pattern_file_magic or version != pattern_file_version
+                or position > len(mapped)):
+            mapped.close()
+            raise ValueError("{} is not a compiled pattern file".format(path))
+        offsets = array.array("I")
+        offsets.frombytes(mapped[_header.size:_header.size
+            + 4 * (num_writes + 1)])
+        offsets = _little_endian(offsets)
+        frame_counts = array.array("H")
+        frame_counts.frombytes(mapped[position - 2 * num_writes:position])
+        if offsets[0] != 0 or offsets[-1] != len(mapped) - position or any(
+                offsets[i] > offsets[i + 1] for i in range(num_writes)):
+            mapped.close()
+            raise ValueError("{} is truncated or corrupt".format(path))
+        pattern = cls(memoryview(mapped)[position:],
+            offsets, _little_endian(frame_counts),
+            num_motors)
+        pattern._mmap = mapped
+        return pattern
+
+    def close(self):
+        """Release the file mapping of a loaded pattern. It must not be
+            playing.
+        """
+        if self._mmap is not None:
+            self.payload.release()
+            self._mmap.close()
+            self._mmap = None
+
+
+def compile_frames(frames, num_motors=4,
+        frames_per_write=default_frames_per_write):
+    """Compile frames into pre-encoded motors vibrate writes
+
+    Args:
+        frames: an iterable of frames, each a list (or buffer) of
+            num_motors intensity values on [0,255]
+
+        num_motors: number of motors on the device
+
+        frames_per_write: frames packed into each write. Writes longer
+            than the device's MTU allows are sent as long writes, so it
+            only has to fit in the device motor queue and in
+            max_attribute_length bytes once encoded.
+
+    Returns:
+        A CompiledPattern
+    """
+    encoder = MotorCommandEncoder()
+    payload = bytearray()
+    offsets = array.array("I", [0])
+    frame_counts = array.array("H")
+    batch = bytearray()
+    batch_frames = 0
+
+    def flush():
+        payload.extend(encoder.encode(batch))
+        offsets.append(len(payload))
+        frame_counts.append(batch_frames)
+
+    for frame in frames:
+        frame = bytearray(frame)
+        if len(frame) != num_motors:
+            raise ValueError("Expected a frame of {} motor values, got {}"
+                .format(num_motors, len(frame)))
+        batch += frame
+        batch_frames += 1
+        if batch_frames == frames_per_write:
+            flush()
+            batch = bytearray()
+            batch_frames = 0
+    if batch_frames:
+        flush()
+    return CompiledPattern(bytes(payload), offsets, frame_counts, num_motors)
+
+
+def illusion_sweep(num_frames, intensity=0.5, start=0.0, end=1.0,
+        min_intensity=0, max_intensity=255, num_motors=4):
+    """Frames moving an illusory point around the wrist at a steady pace
+
+    Args:
+        num_frames: length of the sweep in frames
+
+        intensity: an intensity value on [0,1]
+
+        start: location on [0,1] the sweep starts at
+
+        end: location on [0,1] the sweep ends at
+
+        min_intensity: a minimum motor intensity value
+
+        max_intensity: a maximum motor intensity value
+
+        num_motors: number of motors on the device
+
+    Returns:
+        A list of frames
+    """
+    step = (end - start) / max(1, num_frames - 1)
+    return [get_buzz_illusion_activations(intensity, start + i * step,
+        min_intensity, max_intensity, num_motors)
+        for i in range(num_frames)]
+
+
+def pulse(motor_intensities, on_frames, off_frames, repeats=1):
+    """Frames switching a motor frame on and off
+
+    Args:
+        motor_intensities: the frame played while the pulse is on
+
+        on_frames: frames each pulse lasts
+
+        off_frames: frames of silence after each pulse
+
+        repeats: number of pulses
+
+    Returns:
+        A list of frames
+    """
+    on = list(motor_intensities)
+    off = [0] * len(on)
+    return ([on] * on_frames + [off] * off_frames) * repeats
+
+
+class PatternCache:
+    """A bounded LRU cache of compiled patterns, keyed by the function
+        that generates a pattern's frames and its arguments. Patterns can
+        also be kept as files in a directory, so they are compiled once
+        and memory-mapped on later runs.
+
+    Args:
+        maxsize: number of patterns kept in memory
+
+        directory: where to keep compiled pattern files, or None to keep
+            patterns in memory only
+    """
+
+    def __init__(self, maxsize=128, directory=None):
+        self.maxsize = maxsize
+        self.directory = directory
+        self._patterns = collections.OrderedDict()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def get(self, pattern, *args, key=None, num_motors=4,
+            frames_per_write=default_frames_per_write, **kwargs):
+        """Get a compiled pattern, compiling it on a miss, e.g.
+            cache.get(illusion_sweep, 100, intensity=0.8)
+
+        Args:
+            pattern: a function returning the pattern's frames
+
+            *args, **kwargs: arguments passed on to pattern. Unless key
+                is given, they are part of the cache key: arrays by
+                their values, and anything else by its repr, which must
+                identify it.
+
+            key: a string identifying the pattern and its arguments, in
+                place of the function name and arguments. Patterns from
+                lambdas and nested functions without a key are kept in
+                memory only, as their names are not unique.
+
+            num_motors: number of motors on the device
+
+            frames_per_write: frames packed into each write
+
+        Returns:
+            A CompiledPattern
+        """
+        if key is None:
+            key = "{}.{}{}".format(pattern.__module__, pattern.__qualname__,
+                _argument_key((args, kwargs)))
+            # "<lambda>" or "<locals>"
+            unique = "<" not in pattern.__qualname__
+        else:
+            key = "key:" + key
+            unique = True
+        key = "{}/{}/{}".format(key, num_motors, frames_per_write)
+        path = None
+        if self.directory is not None and unique:
+            path = os.path.join(self.directory, hashlib.sha1(
+                key.encode("utf-8")).hexdigest() + ".neop")
+        if not unique:
+            key = (pattern, key)
+        compiled = self._patterns.get(key)
+        if compiled is not None:
+            self._patterns.move_to_end(key)
+            return compiled
+        if path is not None and os.path.exists(path):
+            try:
+                compiled = CompiledPattern.load(path)
+            except ValueError:
+                # compiled again and rewritten below
+                pass
+        if compiled is None:
+            compiled = compile_frames(pattern(*args, **kwargs), num_motors,
+                frames_per_write)
+            if path is not None:
+                compiled.save(path)
+        self._patterns[key] = compiled
+        if len(self._patterns) > self.maxsize:
+            # evicted patterns may still be playing, so their files are
+            # unmapped when they are garbage collected
+            self._patterns.popitem(last=False)
+        return compiled
+
+    def clear(self):
+        """Empty the in-memory cache. Pattern files are kept."""
+        self._patterns.clear()
@@ -0,0 +1,201 @@
+"""Driving several Neosensory devices together."""
+import asyncio
+
+from . import NeoDevice, _aiter_frames, motor_queue_size
+from .clock import FrameClock
+
+# Seconds a single device may take to complete a pooled command
+default_dispatch_timeout = 1.0
+
+
+class NeoDevicePool:
+    """A group of NeoDevice objects that are commanded concurrently and
+        stream frames against one shared FrameClock, so playback stays
+        phase-aligned across devices. A device that is slow or
+        disconnected is timed out or skipped instead of holding up the
+        others.
+
+    Args:
+        devices: NeoDevice objects, or Bleak clients to wrap in them
+
+        timeout: seconds a single device may take to complete a
+            command before it is abandoned
+
+        clock: the FrameClock to stream against. A new one is made
+            if None.
+    """
+
+    def __init__(self, devices, timeout=default_dispatch_timeout,
+            clock=None):
+        self.devices = [device if isinstance(device, NeoDevice)
+            else NeoDevice(device) for device in devices]
+        self.timeout = timeout
+        self.clock = clock if clock is not None else FrameClock()
+        # frames each device missed because its previous write was
+        # still in progress when the next one was due, or failed
+        self.dropped_frames = [0] * len(self.devices)
+        # the exception of each device's last failed streaming write
+        self.errors = [None] * len(self.devices)
+        self._tasks = [None] * len(self.devices)
+        self._backlogs = [0] * len(self.devices)
+
+    def __len__(self):
+        return len(self.devices)
+
+    def __iter__(self):
+        return iter(self.devices)
+
+    def __getitem__(self, index):
+        return self.devices[index]
+
+    async def _call(self, device, method, args, kwargs):
+        try:
+            return await asyncio.wait_for(
+                getattr(device, method)(*args, **kwargs), self.timeout)
+        except Exception as e:
+            return e
+
+    async def broadcast(self, method, *args, **kwargs):
+        """Call the same NeoDevice method on every device concurrently,
+            e.g. await pool.broadcast("pause_device_algorithm")
+
+        Args:
+            method: name of the NeoDevice coroutine method to call
+
+            *args, **kwargs: arguments passed on to the method
+
+        Returns:
+            A list with each device's result, or the exception it raised
+            (including asyncio.TimeoutError), in device order
+        """
+        return await asyncio.gather(*[self._call(device, method, args,
+            kwargs) for device in self.devices])
+
+    async def call_each(self, method, args_list):
+        """Call a NeoDevice method on every device concurrently with
+            per-device arguments, e.g.
+            await pool.call_each("vibrate_motors", [[frame_a], [frame_b]])
+
+        Args:
+            method: name of the NeoDevice coroutine method to call
+
+            args_list: one sequence of positional arguments per device
+
+        Returns:
+            A list with each device's result, or the exception it raised,
+            in device order
+        """
+        if len(args_list) != len(self.devices):
+            raise ValueError("Expected arguments for {} devices, got {}"
+                .format(len(self.devices), len(args_list)))
+        return await asyncio.gather(*[self._call(device, method, args, {})
+            for device, args in zip(self.devices, args_list)])
+
+    async def stream_frames(self, frames, broadcast=False, num_motors=4,
+            block_frames=None, lead_blocks=1):
+        """Stream frames to all devices against the shared frame clock.
+            Frames are grouped into blocks of block_frames ticks, and each
+            block is written to every device at the same deadline, one
+            multi-frame motors vibrate write per device.
+
+        Args:
+            frames: an iterable or async iterable with one item per tick.
+                If broadcast is True, each item is a single frame sent to
+                every device. Otherwise each item is a sequence holding
+                one frame per device, where None repeats that device's
+                previous frame.
+
+            broadcast: whether each item is a single frame for all devices
+
+            num_motors: number of motors on each device
+
+            block_frames: ticks per write. Defaults to what fits in every
+                device's MTU and in half the device motor queue.
+
+            lead_blocks: how many blocks ahead of playback to write
+
+        Returns:
+            The number of ticks streamed
+        """
+        num_devices = len(self.devices)
+        if block_frames is None:
+            block_frames = min([motor_queue_size // 2]
+                + [device.get_max_frames_per_write(num_motors)
+                for device in self.devices])
+        blocks = [bytearray() for _ in range(num_devices)]
+        last_frames = [bytes(num_motors)] * num_devices
+        # the clock may already have been running for an earlier stream
+        if not self.clock.started:
+            self.clock.start()
+            first_tick = 0
+        else:
+            first_tick = self.clock.current_tick() + 1
+        block_index = 0
+        ticks = 0
+
+        async for item in _aiter_frames(frames):
+            if broadcast:
+                item = [item] * num_devices
+            elif len(item) != num_devices:
+                raise ValueError("Expected frames for {} devices, got {}"
+                    .format(num_devices, len(item)))
+            for i, frame in enumerate(item):
+                if frame is not None:
+                    frame = bytes(bytearray(frame))
+                    if len(frame) != num_motors:
+                        raise ValueError("Expected a frame of {} motor "
+                            "values, got {}".format(num_motors, len(frame)))
+                    last_frames[i] = frame
+                blocks[i] += last_frames[i]
+            ticks += 1
+            if ticks % block_frames == 0:
+                await self._dispatch_block(blocks, block_frames,
+                    first_tick + (block_index - lead_blocks) * block_frames,
+                    lead_blocks)
+                blocks = [bytearray() for _ in range(num_devices)]
+                block_index += 1
+        if ticks % block_frames:
+            await self._dispatch_block(blocks, ticks % block_frames,
+                first_tick + (block_index - lead_blocks) * block_frames,
+                lead_blocks)
+        await self._wait_for_tasks()
+        return ticks
+
+    async def _dispatch_block(self, blocks, num_frames, due_tick,
+            max_backlog):
+        await self.clock.sleep_until(due_tick)
+        for i in range(len(self.devices)):
+            if self._backlogs[i] > max_backlog:
+                # the device has not finished earlier writes, so skip it
+                # rather than let it fall further behind the others
+                self._drop_frames(i, num_frames)
+                continue
+            self._backlogs[i] += 1
+            self._tasks[i] = asyncio.ensure_future(self._send_block(i,
+                self._tasks[i], blocks[i], num_frames))
+
+    async def _send_block(self, index, previous, frame_data, num_frames):
+        # writes to one device stay in order
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            result = await self._call(self.devices[index],
+                "_send_frame_batch", (frame_data, num_frames), {})
+        finally:
+            self._backlogs[index] -= 1
+        if isinstance(result, Exception):
+            self.errors[index] = result
+            self._drop_frames(index, num_frames)
+        return result
+
+    def _drop_frames(self, index, num_frames):
+        self.dropped_frames[index] += num_frames
+        metrics = self.devices[index].metrics
+        if metrics is not None:
+            metrics.dropped_frames += num_frames
+
+    async def _wait_for_tasks(self):
+        pending = [task for task in self._tasks if task is not None]
+        if pending:
+            await asyncio.wait(pending)
+        self._tasks = [None] * len(self.devices)
@@ -0,0 +1,463 @@
+"""Recording the frames sent to a device into a compact binary log, and
+replaying such logs.
+
+A log starts with a file header, followed by blocks of up to a few
+hundred frames. Each block holds its frame count and base timestamp,
+then one 32-bit timestamp offset (in microseconds) per frame, then the
+frames themselves back to back, padded to a multiple of four bytes. A
+4-motor frame costs 8 bytes, and blocks can be used in place from a
+memory-mapped file.
+"""
+import array
+import bisect
+import math
+import mmap
+import struct
+import sys
+import time
+
+from . import motor_frame_period, motor_queue_size
+from .clock import FrameClock
+
+# Identifies a frame log file
+frame_log_magic = b"NEOR"
+frame_log_version = 1
+# magic, version, num_motors, reserved, wall clock start time
+_file_header = struct.Struct("<4sBBHd")
+# number of frames, base timestamp in microseconds
+_block_header = struct.Struct("<IQ")
+_max_offset = 0xFFFFFFFF
+
+
+def _padding(length):
+    return -length % 4
+
+
+class FrameRecorder:
+    """Appends every frame written to a NeoDevice, timestamped with when
+        the device is expected to play it, to a frame log file.
+
+    Args:
+        path: the log file to write
+
+        device: a NeoDevice to record from right away, or None to call
+            attach later
+
+        num_motors: number of motors on the device
+
+        block_frames: frames buffered in memory before they are written
+            out as a block
+    """
+
+    def __init__(self, path, device=None, num_motors=4, block_frames=256):
+        self.num_motors = num_motors
+        self.block_frames = block_frames
+        self.frames_recorded = 0
+        self.device = None
+        self._file = open(path, "wb")
+        self._file.write(_file_header.pack(frame_log_magic,
+            frame_log_version, num_motors, 0, time.time()))
+        self._start = time.monotonic()
+        self._offsets = array.array("I")
+        self._frames = bytearray()
+        self._base = 0
+        if device is not None:
+            self.attach(device)
+
+    def attach(self, device):
+        """Start recording the frames written to a device
+
+        Args:
+            device: the NeoDevice to record
+        """
+        self.detach()
+        device.recorder = self
+        self.device = device
+
+    def detach(self):
+        """Stop recording from the attached device"""
+        if self.device is not None and self.device.recorder is self:
+            self.device.recorder = None
+        self.device = None
+
+    def record(self, frame_data, num_frames, timestamp=None):
+        """Add frames to the log. NeoDevice calls this for each write.
+
+        Args:
+            frame_data: motor intensities of num_frames frames
+
+            num_frames: the number of frames
+
+            timestamp: time.monotonic() time the first frame plays at.
+                Later frames follow on the 16 ms period. Defaults to now.
+        """
+        if timestamp is None:
+            timestamp = time.monotonic()
+        if len(frame_data) != num_frames * self.num_motors:
+            raise ValueError("Expected {} motor values, got {}".format(
+                num_frames * self.num_motors, len(frame_data)))
+        start = int((timestamp - self._start) * 1e6)
+        step = int(motor_frame_period * 1e6)
+        frame_size = self.num_motors
+        # first frame of this write not yet added to self._frames
+        pending = 0
+        for i in range(num_frames):
+            micros = start + i * step
+            if not self._offsets:
+                self._base = micros
+            elif micros - self._base > _max_offset:
+                # the offset no longer fits: end the block with the
+                # frames of this write so far
+                self._frames += frame_data[pending * frame_size:
+                    i * frame_size]
+                pending = i
+                self.flush()
+                self._base = micros
+            self._offsets.append(micros - self._base)
+        self._frames += frame_data[pending * frame_size:]
+        self.frames_recorded += num_frames
+        if len(self._offsets) >= self.block_frames:
+            self.flush()
+
+    def flush(self):
+        """Write buffered frames out as a block"""
+        count = len(self._offsets)
+        if not count:
+            return
+        offsets = self._offsets
+        if sys.byteorder == "big":
+            offsets.byteswap()
+        frames = self._frames[:count * self.num_motors]
+        self._file.write(_block_header.pack(count, self._base))
+        self._file.write(offsets.tobytes())
+        self._file.write(frames)
+        self._file.write(bytes(_padding(len(frames))))
+        self._file.flush()
+        del self._frames[:count * self.num_motors]
+        self._offsets = array.array("I")
+
+    def close(self):
+        """Detach, flush and close the log"""
+        self.detach()
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class FrameLog:
+    """A memory-mapped frame log written by FrameRecorder. Opening one
+        only reads the block headers. Frames and timestamps are read from
+        the mapped file when needed.
+
+    Args:
+        path: the log file to open
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.num_motors, _, self.start_time = \
+            _file_header.unpack_from(self._mmap)
+        if magic != frame_log_magic or version != frame_log_version:
+            self._mmap.close()
+            raise ValueError("{} is not a frame log file".format(path))
+        self._view = memoryview(self._mmap)
+        # per block: index of its first frame, base timestamp, and file
+        # positions of its offsets and frames
+        self._first_frames = []
+        self._bases = []
+        self._positions = []
+        position = _file_header.size
+        num_frames = 0
+        while position + _block_header.size <= len(self._mmap):
+            count, base = _block_header.unpack_from(self._mmap, position)
+            offsets_position = position + _block_header.size
+            frames_position = offsets_position + 4 * count
+            frames_length = count * self.num_motors
+            end = frames_position + frames_length + _padding(frames_length)
+            if end > len(self._mmap):
+                # a partly written block at the end of the file
+                break
+            self._first_frames.append(num_frames)
+            self._bases.append(base)
+            self._positions.append((offsets_position, frames_position))
+            num_frames += count
+            position = end
+        self.num_frames = num_frames
+
+    def __len__(self):
+        return self.num_frames
+
+    def _block_offsets(self, block):
+        offsets_position, frames_position = self._positions[block]
+        view = self._view[offsets_position:frames_position]
+        if sys.byteorder == "big":
+            offsets = array.array("I", view.tobytes())
+            offsets.byteswap()
+            return offsets
+        return view.cast("I")
+
+    def _block_count(self, block):
+        if block + 1 < len(self._first_frames):
+            return self._first_frames[block + 1] - self._first_frames[block]
+        return self.num_frames - self._first_frames[block]
+
+    def timestamp(self, index):
+        """Get when a frame was played, in seconds from the recording start
+
+        Args:
+            index: the frame number
+
+        Returns:
+            The timestamp in seconds
+        """
+        block = bisect.bisect_right(self._first_frames, index) - 1
+        offsets = self._block_offsets(block)
+        return (self._bases[block]
+            + offsets[index - self._first_frames[block]]) / 1e6
+
+    @property
+    def duration(self):
+        if not self.num_frames:
+            return 0.0
+        return self.timestamp(self.num_frames - 1) + motor_frame_period
+
+    def index_at(self, seconds):
+        """Find the frame playing at a time
+
+        Args:
+            seconds: time from the recording start
+
+        Returns:
+            The number of the last frame starting at or before that time,
+            or -1 if it is before the first frame
+        """
+        micros = seconds * 1e6
+        block = bisect.bisect_right(self._bases, micros) - 1
+        if block < 0:
+            return -1
+        offsets = self._block_offsets(block)
+        position = bisect.bisect_right(offsets, micros - self._bases[block])
+        return self._first_frames[block] + position - 1
+
+    def frames(self, start, stop):
+        """Get a run of frames without copying. The run must not cross a
+            block boundary, see block_end.
+
+        Args:
+            start: number of the first frame
+
+            stop: number of the frame after the last
+
+        Returns:
+            A memoryview of the frames' motor intensities
+        """
+        block = bisect.bisect_right(self._first_frames, start) - 1
+        frames_position = self._positions[block][1]
+        first = start - self._first_frames[block]
+        return self._view[frames_position + first * self.num_motors:
+            frames_position + (stop - self._first_frames[block])
+            * self.num_motors]
+
+    def block_end(self, index):
+        """Get the number of the frame after the last one in a frame's block
+
+        Args:
+            index: the frame number
+
+        Returns:
+            The frame number ending the block
+        """
+        block = bisect.bisect_right(self._first_frames, index) - 1
+        return self._first_frames[block] + self._block_count(block)
+
+    def close(self):
+        """Unmap the log file. Views from frames() must be released first."""
+        self._view.release()
+        self._mmap.close()
+
+
+class _FrameCursor:
+    # walks a FrameLog forward in time. A position is searched for only
+    # when the cursor is made, and each block's offsets and frames are
+    # looked up once, when the cursor enters it.
+
+    def __init__(self, log, seconds):
+        self.log = log
+        self.num_frames = len(log)
+        self.index = log.index_at(seconds)
+        self._enter(max(0, bisect.bisect_right(log._first_frames,
+            self.index) - 1))
+        self.time = self._time(self.index) if self.index >= 0 else 0.0
+
+    def _enter(self, block):
+        log = self.log
+        self.block = block
+        self.first = log._first_frames[block]
+        self.end = self.first + log._block_count(block)
+        self.base = log._bases[block]
+        self.offsets = log._block_offsets(block)
+        frames_position = log._positions[block][1]
+        self.frames = log._view[frames_position:frames_position
+            + (self.end - self.first) * log.num_motors]
+
+    def _time(self, index):
+        # index is in the current block or starts the next one
+        if index < self.end:
+            return (self.base + self.offsets[index - self.first]) / 1e6
+        return self.log._bases[self.block + 1] / 1e6
+
+    def next_time(self):
+        # the time of the frame after the current one, or None
+        if self.index + 1 >= self.num_frames:
+            return None
+        return self._time(self.index + 1)
+
+    def advance(self, seconds):
+        # move to the last frame starting at or before seconds, which
+        # must not be earlier than on the last call
+        while self.index + 1 < self.num_frames:
+            next_time = self._time(self.index + 1)
+            if next_time > seconds:
+                break
+            self.index += 1
+            self.time = next_time
+            if self.index == self.end:
+                self._enter(self.block + 1)
+        return self.index
+
+    def frame(self, index):
+        # a view of a frame in the current block
+        num_motors = self.log.num_motors
+        position = (index - self.first) * num_motors
+        return self.frames[position:position + num_motors]
+
+    def release(self):
+        if hasattr(self.offsets, "release"):
+            self.offsets.release()
+        self.frames.release()
+
+
+class FrameReplayer:
+    """Plays a frame log back through a NeoDevice (which may wrap a stand-in
+        client such as the simulator), following the recorded timing at
+        original or scaled speed. Runs of frames are sent as multi-frame
+        writes straight from the memory-mapped log.
+
+    Args:
+        log: a FrameLog, or the path of a log file
+
+        device: the NeoDevice to play on
+
+        speed: playback speed, where 2.0 plays twice as fast by skipping
+            every other frame and 0.5 half as fast by repeating each frame
+    """
+
+    def __init__(self, log, device, speed=1.0):
+        self.log = log if isinstance(log, FrameLog) else FrameLog(log)
+        self.device = device
+        self.speed = speed
+        # playback position in seconds of recorded time
+        self.position = 0.0
+        self._running = False
+
+    def seek(self, seconds):
+        """Move the playback position
+
+        Args:
+            seconds: the recorded time to continue from
+        """
+        self.position = max(0.0, seconds)
+
+    def stop(self):
+        """Make play() return at its next write"""
+        self._running = False
+
+    async def play(self, end=None, queue_size=motor_queue_size):
+        """Play from the current position
+
+        Args:
+            end: recorded time in seconds to stop at. Defaults to the end
+                of the log.
+
+            queue_size: capacity of the device's motor queue in frames
+
+        Returns:
+            The number of frames sent
+        """
+        log = self.log
+        if end is None:
+            end = log.duration
+        step = motor_frame_period * self.speed
+        max_frames = min(self.device.get_max_frames_per_write(
+            log.num_motors), max(1, queue_size // 2))
+        if not len(log):
+            return 0
+        clock = FrameClock()
+        clock.start()
+        start = self.position
+        cursor = _FrameCursor(log, start)
+        tick = 0
+        last_index = -1
+        sent = 0
+        self._running = True
+        try:
+            while self._running:
+                # collect the frames for the ticks of one write. A run of
+                # consecutive frames is sent straight from the log, and
+                # only copied if the run is broken by skipped or repeated
+                # frames.
+                first_tick = tick
+                first_index = None
+                batch = None
+                count = 0
+                while count < max_frames:
+                    now = start + tick * step
+                    if now >= end:
+                        break
+                    index = cursor.advance(now)
+                    if index < 0 or (index == last_index
+                            and now - cursor.time >= motor_frame_period):
+                        # nothing new to play, and the device holds the
+                        # last frame: leave a gap
+                        break
+                    if first_index is None:
+                        first_index = index
+                        block_end = cursor.end
+                    elif batch is None and index != first_index + count:
+                        batch = bytearray(log.frames(first_index,
+                            first_index + count))
+                    elif batch is None and index == block_end:
+                        break
+                    if batch is not None:
+                        batch += cursor.frame(index)
+                    last_index = index
+                    count += 1
+                    tick += 1
+                if count:
+                    if batch is None:
+                        batch = log.frames(first_index, first_index + count)
+                    # send one write ahead of playback
+                    await clock.sleep_until(first_tick - max_frames)
+                    await self.device._send_frame_batch(batch, count,
+                        queue_size)
+                    sent += count
+                    self.position = start + tick * step
+                    continue
+                # skip ahead to the next recorded frame
+                next_time = cursor.next_time()
+                if start + tick * step >= end or next_time is None:
+                    break
+                tick = max(tick + 1, int(math.ceil((next_time - start)
+                    / step)))
+                self.position = start + tick * step
+        finally:
+            self._running = False
+            cursor.release()
+        return sent
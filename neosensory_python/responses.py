@@ -0,0 +1,237 @@
+"""Incremental parsing of the Buzz CLI notification stream and matching of
+responses to the commands that requested them.
+"""
+import asyncio
+import collections
+import json
+
+# Prompt the CLI prints once it is ready for the next command
+cli_prompt = "ncli>"
+
+
+class ResponseParser:
+    """Frames CLI output that arrives split across UART notifications.
+
+        Complete top level JSON objects are decoded into dicts, and any
+        other complete, non-empty line of text is returned as a string.
+        Partial messages are kept until the rest of them arrives.
+
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        # scan state for the JSON object currently being buffered
+        self._scan_index = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, data):
+        """Add received notification data to the parser.
+
+        Args:
+            data: the raw bytes (or str) of a notification
+
+        Returns:
+            A list of the messages completed by this data, each either a
+            dict (for JSON responses) or a str (for lines of text)
+        """
+        if not isinstance(data, str):
+            data = bytes(data).decode("utf-8", errors="replace")
+        self._buffer += data
+        messages = []
+        while self._buffer:
+            if self._depth == 0:
+                if not self._take_text(messages):
+                    break
+            elif not self._take_json(messages):
+                break
+        return messages
+
+    def _take_text(self, messages):
+        # consume text up to a line break or the start of a JSON object
+        buffer = self._buffer
+        brace = buffer.find("{")
+        newline = buffer.find("\n")
+        if brace != -1 and (newline == -1 or brace < newline):
+            self._add_text(buffer[:brace], messages)
+            self._buffer = buffer[brace:]
+            self._scan_index = 0
+            self._depth = 0
+            return self._take_json(messages)
+        if newline != -1:
+            self._add_text(buffer[:newline], messages)
+            self._buffer = buffer[newline + 1:]
+            return True
+        stripped = buffer.lstrip()
+        if stripped.startswith(cli_prompt):
+            # the prompt is not followed by a line break, but the rest of
+            # the line after it may still be on its way
+            self._buffer = stripped[len(cli_prompt):].lstrip()
+            return bool(self._buffer)
+        return False
+
+    def _take_json(self, messages):
+        buffer = self._buffer
+        index = self._scan_index
+        while index < len(buffer):
+            char = buffer[index]
+            index += 1
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._buffer = buffer[index:]
+                    self._scan_index = 0
+                    try:
+                        messages.append(json.loads(buffer[:index]))
+                    except ValueError:
+                        self._add_text(buffer[:index], messages)
+                    return True
+        self._scan_index = index
+        return False
+
+    @staticmethod
+    def _add_text(text, messages):
+        text = text.strip()
+        if text.startswith(cli_prompt):
+            text = text[len(cli_prompt):].strip()
+        if text:
+            messages.append(text)
+
+
+def find_response_value(response, key):
+    """Search a (possibly nested) JSON response for a key.
+
+    Args:
+        response: a dict decoded from a JSON response
+
+        key: the key to look for
+
+    Returns:
+        The first value found for key, or None
+    """
+    if isinstance(response, dict):
+        if key in response:
+            return response[key]
+        values = response.values()
+    elif isinstance(response, list):
+        values = response
+    else:
+        return None
+    for value in values:
+        found = find_response_value(value, key)
+        if found is not None:
+            return found
+    return None
+
+
+def has_response_key(key):
+    """Make a matcher accepting JSON responses that contain key.
+
+    Args:
+        key: the key the response must contain
+
+    Returns:
+        A function usable as the matcher of ResponseRouter.expect
+    """
+    def matcher(message):
+        return find_response_value(message, key) is not None
+    return matcher
+
+
+class ResponseRouter:
+    """Routes parsed CLI messages to the commands waiting for them.
+
+        Pending requests are matched in the order they were made, so a
+        response goes to the oldest request whose matcher accepts it.
+        Messages nobody is waiting for go to the unsolicited listeners.
+
+    """
+
+    def __init__(self):
+        self.parser = ResponseParser()
+        self._pending = collections.deque()
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """Register a function called with every unmatched message
+
+        Args:
+            listener: a function taking one message (dict or str)
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """Unregister a function added with add_listener
+
+        Args:
+            listener: the function to remove
+        """
+        self._listeners.remove(listener)
+
+    def expect(self, matcher=None):
+        """Register interest in an upcoming response. Call this before
+            sending the command so a fast response cannot be missed.
+
+        Args:
+            matcher: a function taking a message and returning whether it
+                is the expected response. If None, the next message
+                matches.
+
+        Returns:
+            A future resolved with the matching message
+        """
+        future = asyncio.get_event_loop().create_future()
+        self._pending.append((matcher, future))
+        return future
+
+    def cancel(self, future):
+        """Stop waiting for a response registered with expect
+
+        Args:
+            future: the future returned by expect
+        """
+        for entry in self._pending:
+            if entry[1] is future:
+                self._pending.remove(entry)
+                break
+        future.cancel()
+
+    def feed(self, data):
+        """Parse notification data and dispatch any completed messages
+
+        Args:
+            data: the raw bytes of a notification
+        """
+        for message in self.parser.feed(data):
+            self.dispatch(message)
+
+    def dispatch(self, message):
+        """Hand a parsed message to its waiting request or the listeners
+
+        Args:
+            message: a parsed message (dict or str)
+        """
+        while self._pending and self._pending[0][1].done():
+            self._pending.popleft()
+        for entry in self._pending:
+            matcher, future = entry
+            if future.done():
+                continue
+            if matcher is None or matcher(message):
+                self._pending.remove(entry)
+                future.set_result(message)
+                return
+        for listener in self._listeners:
+            listener(message)
@@ -0,0 +1,180 @@
+"""A single-producer, single-consumer ring buffer of motor frames that can
+live in shared memory, for handing frames to a device's event loop from
+another thread or process without locks or per-frame calls.
+"""
+import struct
+
+from . import motor_queue_size
+
+# frames written, frames read, capacity, num_motors
+_header = struct.Struct("=QQII")
+# the frames start on an 8 byte boundary after the header
+_header_size = 32
+
+
+def _byte_view(frame_data):
+    # a flat byte view of frame data, which must be one byte per value
+    try:
+        view = memoryview(frame_data)
+    except TypeError:
+        return memoryview(bytes(frame_data))
+    if view.itemsize != 1:
+        raise ValueError("Motor data must be one byte per value, got an "
+            "item size of {}".format(view.itemsize))
+    if not view.c_contiguous:
+        return memoryview(view.tobytes())
+    return view.cast("B")
+
+
+class FrameRingBuffer:
+    """A fixed-size ring of motor frames with one producer and one
+        consumer, which may be different threads or processes. Each side
+        only ever advances its own counter (frames written, or frames
+        read), so neither side takes a lock. The counters only grow, and
+        a slot is reused only once the consumer has moved past it.
+
+        Pass shared=True to place the buffer in multiprocessing shared
+        memory. Another process can then open it with
+        FrameRingBuffer.attach(ring.name) and write frames into it.
+
+    Args:
+        capacity: number of frames the buffer holds
+
+        num_motors: number of motor values per frame
+
+        shared: whether to allocate the buffer in shared memory
+
+        name: the shared memory block name, or None for a generated one
+    """
+
+    def __init__(self, capacity=8 * motor_queue_size, num_motors=4,
+            shared=False, name=None):
+        size = _header_size + capacity * num_motors
+        self._shared_memory = None
+        if shared:
+            from multiprocessing import shared_memory
+            self._shared_memory = shared_memory.SharedMemory(name=name,
+                create=True, size=size)
+            buffer = self._shared_memory.buf
+        else:
+            buffer = bytearray(size)
+        _header.pack_into(buffer, 0, 0, 0, capacity, num_motors)
+        self._owner = True
+        self._set_up(buffer)
+
+    @classmethod
+    def attach(cls, name):
+        """Open a shared ring buffer created in another process
+
+        Args:
+            name: the name of the buffer's shared memory block
+
+        Returns:
+            A FrameRingBuffer using the same memory
+        """
+        from multiprocessing import shared_memory
+        ring = cls.__new__(cls)
+        ring._shared_memory = shared_memory.SharedMemory(name=name)
+        ring._owner = False
+        ring._set_up(ring._shared_memory.buf)
+        return ring
+
+    def _set_up(self, buffer):
+        self._buffer = memoryview(buffer)
+        _, _, self.capacity, self.num_motors = _header.unpack_from(
+            self._buffer)
+        self._counters = self._buffer[:16].cast("Q")
+        self._frames = self._buffer[_header_size:]
+
+    @property
+    def name(self):
+        """The shared memory block name, or None if not shared"""
+        if self._shared_memory is None:
+            return None
+        return self._shared_memory.name
+
+    def __len__(self):
+        """The number of frames waiting to be read"""
+        return self._counters[0] - self._counters[1]
+
+    @property
+    def free(self):
+        """The number of frames that can be written without waiting"""
+        return self.capacity - len(self)
+
+    def write(self, frame_data):
+        """Add frames, as many as there is room for. Producer side only.
+
+        Args:
+            frame_data: motor intensities of one or more frames, as a
+                bytes-like object (such as a uint8 array of shape
+                (frames, num_motors)) or a list of values on [0,255]
+
+        Returns:
+            The number of frames written, which is less than given if
+            the buffer is full
+        """
+        data = _byte_view(frame_data)
+        num_motors = self.num_motors
+        if len(data) % num_motors:
+            raise ValueError("Expected a multiple of {} motor values, got {}"
+                .format(num_motors, len(data)))
+        written, read = self._counters
+        count = min(len(data) // num_motors, self.capacity - (written - read))
+        position = written % self.capacity
+        first = min(count, self.capacity - position)
+        self._frames[position * num_motors:(position + first) * num_motors] \
+            = data[:first * num_motors]
+        if count > first:
+            self._frames[:(count - first) * num_motors] = \
+                data[first * num_motors:count * num_motors]
+        # publish the frames only once they are in place
+        self._counters[0] = written + count
+        return count
+
+    def read(self, max_frames):
+        """Take frames out of the buffer. Consumer side only.
+
+        Args:
+            max_frames: the most frames to take
+
+        Returns:
+            A (frame_data, num_frames) pair, where frame_data is bytes
+        """
+        written, read = self._counters
+        count = min(max_frames, written - read)
+        num_motors = self.num_motors
+        position = read % self.capacity
+        first = min(count, self.capacity - position)
+        data = bytes(self._frames[position * num_motors:
+            (position + first) * num_motors])
+        if count > first:
+            data += bytes(self._frames[:(count - first) * num_motors])
+        # hand the slots back to the producer once copied out
+        self._counters[1] = read + count
+        return data, count
+
+    def discard(self):
+        """Drop every frame waiting to be read. Consumer side only.
+
+        Returns:
+            The number of frames dropped
+        """
+        written, read = self._counters
+        self._counters[1] = written
+        return written - read
+
+    def close(self):
+        """Release the buffer. A shared buffer created here is also
+            removed, so other processes should close theirs first.
+        """
+        if self._frames is None:
+            return
+        self._counters.release()
+        self._frames.release()
+        self._buffer.release()
+        self._frames = None
+        if self._shared_memory is not None:
+            self._shared_memory.close()
+            if self._owner:
+                self._shared_memory.unlink()
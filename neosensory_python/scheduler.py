@@ -0,0 +1,98 @@
+"""Deadline-based playback of motor frames."""
+import time
+
+from . import _aiter_frames, motor_frame_period
+from .clock import FrameClock
+
+
+class FrameScheduler:
+    """Plays frames on a NeoDevice at absolute deadlines on the device's
+        16 ms tick, instead of sleeping a fixed time between frames. The
+        time taken to produce and send a frame does not add up as drift,
+        and when playback falls behind, stale frames are dropped so it
+        catches up rather than building a backlog.
+
+    Args:
+        device: the NeoDevice to play on
+
+        clock: the FrameClock that deadlines are taken from. Share one
+            clock between schedulers to keep devices in phase. A new one
+            is made if None.
+
+        max_lateness: seconds a frame may be behind its deadline and
+            still be sent. Later frames are dropped.
+    """
+
+    def __init__(self, device, clock=None, max_lateness=motor_frame_period):
+        self.device = device
+        self.clock = clock if clock is not None else FrameClock()
+        self.max_lateness = max_lateness
+        self.frames_sent = 0
+        self.late_frames = 0
+        self.dropped_frames = 0
+        self.max_lateness_seen = 0.0
+        self._stopping = False
+
+    def stop(self):
+        """Make play() return before its next frame. If it is not
+            playing, the next call to play() returns without playing.
+        """
+        self._stopping = True
+
+    async def play(self, source, interval_ticks=1):
+        """Play frames until the source runs out or stop() is called.
+
+        Args:
+            source: where frames come from. Either a function taking a
+                tick number and returning the frame for it (None to
+                finish), or an iterable or async iterable yielding one
+                frame per interval.
+
+            interval_ticks: device ticks between frames, e.g. 6 for
+                roughly 10 frames per second
+
+        Returns:
+            The number of frames sent
+        """
+        if not self.clock.started:
+            self.clock.start()
+            tick = 0
+        else:
+            tick = self.clock.current_tick() + 1
+        frames = None if callable(source) else _aiter_frames(source)
+        sent = 0
+        try:
+            while not self._stopping:
+                lateness = await self.clock.sleep_until(tick)
+                if lateness > self.max_lateness:
+                    # skip ahead to the most recent interval that is due
+                    skip = int((time.monotonic() - self.clock.deadline(tick))
+                        / (interval_ticks * self.clock.period))
+                    if frames is not None:
+                        for _ in range(skip):
+                            await frames.__anext__()
+                    tick += skip * interval_ticks
+                    self.dropped_frames += skip
+                    if self.device.metrics is not None:
+                        self.device.metrics.dropped_frames += skip
+                    lateness = time.monotonic() - self.clock.deadline(tick)
+                if lateness > 0:
+                    self.max_lateness_seen = max(self.max_lateness_seen,
+                        lateness)
+                if frames is None:
+                    frame = source(tick)
+                    if frame is None:
+                        break
+                else:
+                    frame = await frames.__anext__()
+                if lateness > self.max_lateness:
+                    self.late_frames += 1
+                await self.device.vibrate_motors(frame)
+                sent += 1
+                tick += interval_ticks
+        except StopAsyncIteration:
+            pass
+        finally:
+            self._stopping = False
+            self.frames_sent += sent
+        return sent
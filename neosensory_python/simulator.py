@@ -0,0 +1,303 @@
+"""An in-process stand-in for a Neosensory Buzz, for testing and
+benchmarking without a Bluetooth radio.
+
+SimulatedBuzzClient implements the parts of the Bleak client interface
+that NeoDevice uses, and emulates the Buzz UART CLI behind it:
+developer authorization, audio and motor control, the motor FIFO
+played out on a 16 ms period, and the device info and battery queries.
+The link can be given latency, jitter and loss.
+"""
+import asyncio
+import base64
+import binascii
+import collections
+import json
+import random
+import time
+
+from . import max_attribute_length, motor_frame_period, motor_queue_size, \
+    ns_uart_rx_id, ns_uart_tx_id
+
+_auth_prompt = ("Please type 'accept' and hit enter to agree to Neosensory "
+    "Inc's Developer Terms and Conditions, which can be viewed at "
+    "https://neosensory.com/legal/dev-terms-service")
+
+
+class SimulatedBuzzClient:
+    """Emulates a connected Neosensory Buzz behind the Bleak client
+        interface used by NeoDevice (connect, disconnect, is_connected,
+        mtu_size, start_notify, stop_notify and write_gatt_char).
+
+    Args:
+        address: the address the simulated device reports
+
+        mtu_size: the negotiated ATT MTU. Writes longer than
+            mtu_size - 3 bytes go through as long writes, the way the BLE
+            stack splits them. Writes longer than an attribute can hold
+            (512 bytes) are dropped and counted in oversized_writes.
+
+        num_motors: number of motors on the device
+
+        queue_size: capacity of the motor FIFO in frames. Frames that do
+            not fit are dropped and counted in overflowed_frames.
+
+        latency: seconds between a write being sent and the device
+            acting on it. Notifications take as long to come back.
+
+        jitter: maximum extra random latency in seconds
+
+        loss: probability that a write is lost on the link
+
+        seed: seed for the random number generator used for jitter and
+            loss
+
+        battery_soc: the battery level reported by device battery_soc
+
+        record_playback: whether to log every frame played out in
+            playback_log as (send_time, play_time, frame) tuples, with
+            times from time.monotonic()
+
+        disconnected_callback: a function called with this client when
+            it disconnects, like Bleak's disconnected_callback
+    """
+
+    def __init__(self, address="SIM:BU:ZZ:00:00:00", mtu_size=247,
+            num_motors=4, queue_size=motor_queue_size, latency=0.0,
+            jitter=0.0, loss=0.0, seed=None, battery_soc=100,
+            record_playback=False, disconnected_callback=None):
+        self.address = address
+        self.mtu_size = mtu_size
+        self.num_motors = num_motors
+        self.queue_size = queue_size
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.battery_soc = battery_soc
+        self.record_playback = record_playback
+        self.disconnected_callback = disconnected_callback
+        self.playback_log = []
+        self._random = random.Random(seed)
+        self._connected = False
+        self._notify_callback = None
+        self._line_buffer = b""
+        self.reset()
+
+    def reset(self):
+        """Return the emulated firmware to its power-on state"""
+        self.auth_state = "none"
+        self.audio_running = True
+        self.motors_enabled = False
+        self.current_frame = bytes(self.num_motors)
+        self.commands = []
+        self.frames_received = 0
+        self.frames_played = 0
+        self.overflowed_frames = 0
+        self.underruns = 0
+        self.lost_writes = 0
+        self.oversized_writes = 0
+        # frames waiting to play, as (send_time, frame) pairs
+        self._queue = collections.deque()
+        self._next_play_time = 0.0
+
+    @property
+    def is_connected(self):
+        return self._connected
+
+    @property
+    def authorized(self):
+        return self.auth_state == "authorized"
+
+    async def connect(self, **kwargs):
+        self._connected = True
+        return True
+
+    async def disconnect(self):
+        was_connected = self._connected
+        self._connected = False
+        self._notify_callback = None
+        if was_connected and self.disconnected_callback is not None:
+            self.disconnected_callback(self)
+        return True
+
+    def simulate_disconnect(self):
+        """Drop the link as if the device went out of range, and lose
+            the session state like a real device would.
+        """
+        self._connected = False
+        self._notify_callback = None
+        self.reset()
+        if self.disconnected_callback is not None:
+            self.disconnected_callback(self)
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.disconnect()
+
+    async def start_notify(self, char_specifier, callback, **kwargs):
+        self._check_connected()
+        self._notify_callback = callback
+
+    async def stop_notify(self, char_specifier):
+        self._notify_callback = None
+
+    async def write_gatt_char(self, char_specifier, data, response=False):
+        self._check_connected()
+        if str(char_specifier).lower() != str(ns_uart_rx_id).lower():
+            raise ValueError("Unknown characteristic {}".format(
+                char_specifier))
+        data = bytes(data)
+        send_time = time.monotonic()
+        delay = self._get_link_delay()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.loss and self._random.random() < self.loss:
+            self.lost_writes += 1
+            return
+        if len(data) > max_attribute_length:
+            self.oversized_writes += 1
+            return
+        self._line_buffer += data
+        while b"\n" in self._line_buffer:
+            line, self._line_buffer = self._line_buffer.split(b"\n", 1)
+            line = line.strip().decode("utf-8", errors="replace")
+            if line:
+                self._handle_command(line, send_time)
+
+    def get_queue_depth(self):
+        """Get the number of frames waiting in the motor FIFO
+
+        Returns:
+            The number of queued frames
+        """
+        self._advance(time.monotonic())
+        return len(self._queue)
+
+    def get_current_frame(self):
+        """Get the frame the motors are playing right now
+
+        Returns:
+            The motor intensities as bytes
+        """
+        self._advance(time.monotonic())
+        return self.current_frame
+
+    def _check_connected(self):
+        if not self._connected:
+            raise ConnectionError("Simulated Buzz {} is not connected"
+                .format(self.address))
+
+    def _get_link_delay(self):
+        if self.jitter:
+            return self.latency + self._random.uniform(0, self.jitter)
+        return self.latency
+
+    def _advance(self, now):
+        # play out every queued frame whose slot has started by now
+        queue = self._queue
+        while queue and self._next_play_time <= now:
+            send_time, frame = queue.popleft()
+            self.current_frame = frame
+            self.frames_played += 1
+            if self.record_playback:
+                self.playback_log.append((send_time, self._next_play_time,
+                    frame))
+            self._next_play_time += motor_frame_period
+
+    def _enqueue_frames(self, frames, send_time):
+        now = time.monotonic()
+        self._advance(now)
+        if not self._queue and self._next_play_time < now:
+            # the queue ran dry before these frames arrived
+            if self.frames_played:
+                self.underruns += 1
+            self._next_play_time = now
+        for i in range(0, len(frames), self.num_motors):
+            if len(self._queue) >= self.queue_size:
+                self.overflowed_frames += 1
+                continue
+            self._queue.append((send_time, frames[i:i + self.num_motors]))
+        self._advance(now)
+
+    def _clear_queue(self):
+        self._advance(time.monotonic())
+        self._queue.clear()
+
+    def _handle_command(self, line, send_time):
+        self.commands.append(line)
+        if line == "auth as developer":
+            self.auth_state = "pending"
+            self._respond(_auth_prompt)
+        elif line == "accept":
+            if self.auth_state == "none":
+                self._respond("Error: call 'auth as developer' first")
+            else:
+                self.auth_state = "authorized"
+                self._respond("Developer API access granted")
+        elif line == "device info":
+            self._respond(json.dumps({"type": "device_info", "data": {
+                "serial_number": self.address.replace(":", ""),
+                "firmware_version": "simulated",
+                "num_motors": self.num_motors}}))
+        elif line == "device battery_soc":
+            self._respond(json.dumps({"type": "battery_soc",
+                "data": {"battery_soc": self.battery_soc}}))
+        elif not self.authorized:
+            self._respond("Error: developer authorization required")
+        elif line == "audio start":
+            self.audio_running = True
+            self._respond("OK")
+        elif line == "audio stop":
+            self.audio_running = False
+            self._respond("OK")
+        elif line == "motors start":
+            self.motors_enabled = True
+            self._respond("OK")
+        elif line == "motors stop":
+            self._clear_queue()
+            self.motors_enabled = False
+            self.current_frame = bytes(self.num_motors)
+            self._respond("OK")
+        elif line == "motors clear_queue":
+            self._clear_queue()
+            self._respond("OK")
+        elif line.startswith("motors vibrate "):
+            self._handle_vibrate(line[len("motors vibrate "):], send_time)
+        else:
+            self._respond("Error: unknown command '{}'".format(line))
+
+    def _handle_vibrate(self, argument, send_time):
+        if not self.motors_enabled or self.audio_running:
+            self._respond("Error: call 'audio stop' and 'motors start' "
+                "first")
+            return
+        try:
+            frames = base64.b64decode(argument.strip('"'), validate=True)
+        except (binascii.Error, ValueError):
+            self._respond("Error: invalid base64 encoding")
+            return
+        if not frames or len(frames) % self.num_motors:
+            self._respond("Error: expected a multiple of {} motor values"
+                .format(self.num_motors))
+            return
+        self.frames_received += len(frames) // self.num_motors
+        self._enqueue_frames(frames, send_time)
+
+    def _respond(self, text):
+        callback = self._notify_callback
+        if callback is None:
+            return
+        data = (text + "\r\nncli> ").encode("utf-8")
+        chunk_size = max(1, self.mtu_size - 3)
+        chunks = [data[i:i + chunk_size]
+            for i in range(0, len(data), chunk_size)]
+        delay = self._get_link_delay()
+        loop = asyncio.get_event_loop()
+        for chunk in chunks:
+            if delay > 0:
+                loop.call_later(delay, callback, ns_uart_tx_id,
+                    bytearray(chunk))
+            else:
+                loop.call_soon(callback, ns_uart_tx_id, bytearray(chunk))
@@ -0,0 +1,236 @@
+"""A blocking interface to a NeoDevice for code that does not run an
+asyncio event loop, such as sensor reader threads or other processes.
+"""
+import asyncio
+import threading
+import time
+
+from . import motor_frame_period, motor_queue_size
+from .connection import NeoConnection
+from .ringbuffer import FrameRingBuffer, _byte_view
+
+
+class SyncNeoDevice:
+    """Runs a NeoDevice's event loop in a dedicated thread and takes
+        frames through a FrameRingBuffer. Producers write frames into the
+        ring from their own thread (or, with a shared ring, their own
+        process), and the loop thread drains it in batches of up to one
+        full write into the device's paced streaming path. Producers
+        never wait on the event loop, and there is no per-frame call
+        between threads.
+
+    Args:
+        connection: an object whose async connect() returns the
+            NeoDevice and whose async disconnect() closes it, such as a
+            NeoConnection. A NeoConnection with default settings is
+            used if None.
+
+        ring: the FrameRingBuffer to drain. One that is not shared is
+            made if None.
+
+        num_motors: number of motors on the device
+
+        queue_size: capacity of the device's motor queue in frames
+
+        low_water_mark: when the estimated device queue depth drops to
+            this many frames, waiting frames are sent without waiting
+            for a full write
+
+        poll_interval: seconds between checks of an empty ring
+    """
+
+    def __init__(self, connection=None, ring=None, num_motors=4,
+            queue_size=motor_queue_size, low_water_mark=2,
+            poll_interval=motor_frame_period / 4):
+        self.connection = connection
+        self._owns_ring = ring is None
+        self.ring = ring if ring is not None else FrameRingBuffer(
+            num_motors=num_motors)
+        self.num_motors = num_motors
+        self.queue_size = queue_size
+        self.low_water_mark = low_water_mark
+        self.poll_interval = poll_interval
+        self.device = None
+        self.frames_sent = 0
+        # frames taken from the ring whose write failed
+        self.dropped_frames = 0
+        self._loop = None
+        self._thread = None
+        self._drain_task = None
+        self._running = False
+
+    def start(self, timeout=None):
+        """Start the loop thread, connect and start draining the ring
+
+        Args:
+            timeout: seconds to wait for the connection
+        """
+        if self._thread is not None:
+            return
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever,
+            name="SyncNeoDevice", daemon=True)
+        self._thread.start()
+        try:
+            self._run(self._start(), timeout)
+        except BaseException:
+            self._stop_loop()
+            raise
+
+    async def _start(self):
+        if self.connection is None:
+            self.connection = NeoConnection()
+        self.device = await self.connection.connect()
+        self._running = True
+        self._drain_task = asyncio.ensure_future(self._drain())
+
+    def close(self, timeout=None):
+        """Stop draining, disconnect and stop the loop thread. Frames
+            still in the ring are dropped, and a ring made here is
+            released.
+
+        Args:
+            timeout: seconds to wait for the disconnection
+        """
+        if self._thread is None:
+            return
+        try:
+            self._run(self._close(), timeout)
+        finally:
+            self._stop_loop()
+            self.ring.discard()
+            if self._owns_ring:
+                self.ring.close()
+
+    async def _close(self):
+        self._running = False
+        if self._drain_task is not None:
+            # it may be waiting for a dropped connection to come back
+            self._drain_task.cancel()
+            try:
+                await self._drain_task
+            except asyncio.CancelledError:
+                pass
+            self._drain_task = None
+        await self.connection.disconnect()
+
+    def _stop_loop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _run(self, coroutine, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coroutine,
+            self._loop).result(timeout)
+
+    def call(self, method, *args, timeout=None, **kwargs):
+        """Call a NeoDevice method in the loop thread and wait for its
+            result, e.g. sync_buzz.call("get_battery_level")
+
+        Args:
+            method: the name of the NeoDevice method
+
+            *args, **kwargs: arguments passed on to the method
+
+            timeout: seconds to wait before raising
+                concurrent.futures.TimeoutError
+
+        Returns:
+            What the method returns
+        """
+        return self._run(getattr(self.device, method)(*args, **kwargs),
+            timeout)
+
+    def write_frames(self, frame_data, block=True, timeout=None):
+        """Queue frames for streaming. Call this from a single producer
+            thread. Another process can write to a shared ring directly.
+
+        Args:
+            frame_data: motor intensities of one or more frames, as a
+                bytes-like object or a list of values on [0,255]
+
+            block: whether to wait for room in the ring when it is full.
+                If False, frames that do not fit are dropped.
+
+            timeout: seconds to wait for room, or None to wait as long
+                as it takes
+
+        Returns:
+            The number of frames queued
+        """
+        view = _byte_view(frame_data)
+        num_frames = len(view) // self.num_motors
+        written = self.ring.write(view)
+        if not block or written == num_frames:
+            return written
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while written < num_frames:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            # the ring drains at most one frame per device tick
+            time.sleep(motor_frame_period)
+            written += self.ring.write(view[written * self.num_motors:])
+        return written
+
+    def vibrate_motors(self, motor_list, timeout=None):
+        """Send one frame with NeoDevice.vibrate_motors, without going
+            through the ring
+
+        Args:
+            motor_list: a list of motor intensity values on [0,255]
+
+            timeout: seconds to wait for the write
+        """
+        self.call("vibrate_motors", motor_list, timeout=timeout)
+
+    def stop_motors(self, timeout=None):
+        """Drop the frames waiting in the ring and turn off the motors
+
+        Args:
+            timeout: seconds to wait for the write
+        """
+        self._run(self._stop_motors(), timeout)
+
+    async def _stop_motors(self):
+        # the ring is only read from the loop thread
+        self.ring.discard()
+        await self.device.stop_motors()
+
+    async def _drain(self):
+        device = self.device
+        ring = self.ring
+        max_frames = min(device.get_max_frames_per_write(self.num_motors),
+            max(1, self.queue_size // 2))
+        while self._running:
+            available = len(ring)
+            if not available or (available < max_frames
+                    and device.estimate_queue_depth() > self.low_water_mark):
+                # wait for a full write's worth of frames unless the
+                # device is about to run out
+                await asyncio.sleep(self.poll_interval)
+                continue
+            await device._wait_for_queue_space(min(available, max_frames),
+                self.queue_size)
+            frame_data, num_frames = ring.read(max_frames)
+            try:
+                await device._send_frame_batch(frame_data, num_frames,
+                    self.queue_size)
+            except Exception:
+                self.dropped_frames += num_frames
+                if device.metrics is not None:
+                    device.metrics.dropped_frames += num_frames
+                wait_connected = getattr(self.connection, "wait_connected",
+                    None)
+                if wait_connected is not None:
+                    await wait_connected()
+                continue
+            self.frames_sent += num_frames
@@ -14,6 +14,7 @@ setuptools.setup(
     url="https://github.com/neosensory/neosensory-sdk-for-python",
     packages=setuptools.find_packages(),
     install_requires=['bleak'],
+    extras_require={'numpy': ['numpy']},
     classifiers=[
         "Development Status :: 1 - Planning",
         "License :: OSI Approved :: Apache Software License",
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from neosensory_python.audio import AudioHapticsPipeline
+
+sample_rate = 16000
+
+
+def sine(frequency, seconds=1.0, amplitude=0.5):
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    return (amplitude * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+
+def test_sine_drives_its_band():
+    pipeline = AudioHapticsPipeline(sample_rate)
+    audio = sine(1500.0)
+    frames = np.array(list(pipeline.frames(audio)))
+    assert len(frames) == int(len(audio) / pipeline.hop)
+    # bands are 100-299, 299-894, 894-2675 and 2675-8000 Hz
+    steady = frames[2:]
+    assert (steady.argmax(axis=1) == 2).all()
+    assert (steady[:, 2] > 200).all()
+    assert (steady[:, [0, 3]] < steady[:, [2]] // 2).all()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 100, 257, 4096, 16000])
+def test_chunk_size_does_not_change_frames(chunk_size):
+    audio = np.concatenate((sine(200.0, 0.5), sine(3000.0, 0.5)))
+    expected = AudioHapticsPipeline(sample_rate).process(audio)
+    frames = np.array(list(AudioHapticsPipeline(sample_rate).frames(audio,
+        chunk_size)))
+    assert frames.shape == expected.shape
+    assert (frames == expected).all()
+
+
+def test_unsigned_pcm_has_no_offset():
+    audio = sine(1500.0, 0.25)
+    signed = np.rint(audio * 128).astype(np.int8)
+    unsigned = (signed.astype(np.int16) + 128).astype(np.uint8)
+    assert (AudioHapticsPipeline(sample_rate).process(unsigned)
+        == AudioHapticsPipeline(sample_rate).process(signed)).all()
+    silence = np.full(sample_rate // 4, 128, dtype=np.uint8)
+    assert not AudioHapticsPipeline(sample_rate).process(silence).any()
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+from neosensory_python import get_buzz_illusion_activations, \
+    get_motor_intensity
+from neosensory_python.batch import compose_illusion_sources, \
+    get_buzz_illusion_activations_batch, get_motor_intensities, \
+    soft_saturation_knee
+
+intensities = np.linspace(0.0, 1.0, 41)
+locations = np.linspace(0.0, 1.0, 37)
+
+
+@pytest.mark.parametrize("min_intensity", [0, 40])
+@pytest.mark.parametrize("saturation", ["clip", "normalize", "soft"])
+def test_single_source_matches_scalar(min_intensity, saturation):
+    grid_intensity, grid_location = np.meshgrid(intensities, locations)
+    frames = compose_illusion_sources(grid_intensity.ravel()[:, None],
+        grid_location.ravel()[:, None], min_intensity, 255, 4,
+        saturation=saturation)
+    for frame, intensity, location in zip(frames, grid_intensity.ravel(),
+            grid_location.ravel()):
+        expected = get_buzz_illusion_activations(intensity, location,
+            min_intensity, 255, 4)
+        if saturation == "soft" and max(expected) > soft_saturation_knee \
+                * 255:
+            assert all(frame <= expected)
+        else:
+            assert list(frame) == expected
+
+
+def test_soft_saturation_only_limits_loud_values():
+    frames = compose_illusion_sources([[1.0, 1.0], [0.4, 0.0]],
+        [[0.0, 0.0], [0.0, 0.0]], 0, 255, 4, saturation="soft")
+    quiet = get_buzz_illusion_activations(0.4, 0.0, 0, 255, 4)
+    assert list(frames[1]) == quiet
+    # two full sources on one motor approach the maximum smoothly
+    assert 250 <= frames[0][0] < 255
+    loud = compose_illusion_sources([[0.9, 0.0]], [[0.0, 0.0]], 0, 255, 4,
+        saturation="soft")
+    assert loud[0][0] < get_buzz_illusion_activations(0.9, 0.0, 0, 255,
+        4)[0]
+
+
+@pytest.mark.parametrize("mix", ["sum", "max", "power"])
+def test_mixing_two_sources(mix):
+    frame = compose_illusion_sources([0.6, 0.6], [0.0, 1.0], 0, 255, 4,
+        mix=mix)[0]
+    single = get_buzz_illusion_activations(0.6, 0.0, 0, 255, 4)[0]
+    assert list(frame) == [single, 0, 0, single]
+    overlap = compose_illusion_sources([0.6, 0.6], [0.0, 0.0], 0, 255, 4,
+        mix=mix)[0][0]
+    expected = {"sum": 2 * single, "max": single,
+        "power": int(np.sqrt(2) * single)}[mix]
+    assert overlap == min(255, expected)
+
+
+def test_normalize_keeps_proportions():
+    frame = compose_illusion_sources([1.0, 1.0, 1.0], [0.0, 0.0, 1.0], 0,
+        255, 4, saturation="normalize")[0]
+    assert frame[0] == 255
+    assert frame[3] == 127
+
+
+def test_unknown_options_are_rejected():
+    with pytest.raises(ValueError):
+        compose_illusion_sources([1.0], [0.0], 0, 255, 4, mix="average")
+    with pytest.raises(ValueError):
+        compose_illusion_sources([1.0], [0.0], 0, 255, 4, saturation="x")
+
+
+@pytest.mark.parametrize("min_intensity", [0, 40])
+def test_intensities_within_one_step_of_scalar(min_intensity):
+    values = np.linspace(-0.1, 1.1, 1201)
+    batch = get_motor_intensities(values, min_intensity, 255)
+    assert batch.dtype == np.uint8
+    for linear, motor in zip(values, batch):
+        expected = get_motor_intensity(linear, min_intensity, 255)
+        assert abs(int(motor) - expected) <= 1
+
+
+@pytest.mark.parametrize("min_intensity", [0, 40])
+def test_illusion_batch_within_one_step_of_scalar(min_intensity):
+    grid_intensity, grid_location = np.meshgrid(intensities, locations)
+    frames = get_buzz_illusion_activations_batch(grid_intensity,
+        grid_location, min_intensity, 255, 4)
+    assert frames.shape == (grid_intensity.size, 4)
+    assert frames.flags.c_contiguous
+    for frame, intensity, location in zip(frames, grid_intensity.ravel(),
+            grid_location.ravel()):
+        expected = get_buzz_illusion_activations(intensity, location,
+            min_intensity, 255, 4)
+        assert np.abs(frame.astype(int) - expected).max() <= 1
+    # the end of the wrist is the last motor alone
+    assert list(get_buzz_illusion_activations_batch([1.0], [1.0],
+        min_intensity, 255, 4)[0]) == [0, 0, 0, 255]
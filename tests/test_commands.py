@@ -0,0 +1,117 @@
+import asyncio
+
+from neosensory_python import NeoDevice
+from neosensory_python.simulator import SimulatedBuzzClient
+
+frame = [255, 0, 0, 0]
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+async def connect(client=None):
+    if client is None:
+        client = SimulatedBuzzClient()
+    await client.connect()
+    device = NeoDevice(client)
+    await device.start_developer_session()
+    return device, client
+
+
+async def settle():
+    # let the simulated device play out what it was sent
+    await asyncio.sleep(0.05)
+
+
+def test_repeated_frame_is_coalesced():
+    async def scenario():
+        device, client = await connect()
+        await device.vibrate_motors(frame)
+        await device.vibrate_motors(frame)
+        return device.commands.coalesced_frames, client.frames_received
+    assert run(scenario()) == (1, 1)
+
+
+def test_frame_resent_after_motors_restart():
+    async def scenario():
+        device, client = await connect()
+        await device.vibrate_motors(frame)
+        await device.disable_motors()
+        await device.enable_motors()
+        await device.vibrate_motors(frame)
+        await settle()
+        return device.commands.coalesced_frames, client.get_current_frame()
+    assert run(scenario()) == (0, bytes(frame))
+
+
+def test_frame_resent_after_clear_queue():
+    async def scenario():
+        device, client = await connect()
+        await device.vibrate_motors([0, 0, 0, 0] * 7 + frame)
+        await device.clear_motor_queue()
+        await device.vibrate_motors(frame)
+        await settle()
+        return device.commands.coalesced_frames, client.get_current_frame()
+    assert run(scenario()) == (0, bytes(frame))
+
+
+def test_frame_resent_to_new_client():
+    async def scenario():
+        device, _ = await connect()
+        await device.vibrate_motors(frame)
+        client = SimulatedBuzzClient()
+        await client.connect()
+        device.set_client(client)
+        await device.start_developer_session()
+        await device.vibrate_motors(frame)
+        await settle()
+        return client.frames_received, client.get_current_frame()
+    assert run(scenario()) == (1, bytes(frame))
+
+
+def test_failed_write_is_not_coalesced():
+    async def scenario():
+        device, client = await connect()
+        write_gatt_char = client.write_gatt_char
+
+        async def failing_write(*args, **kwargs):
+            client.write_gatt_char = write_gatt_char
+            raise ConnectionError("link lost")
+        client.write_gatt_char = failing_write
+        try:
+            await device.vibrate_motors(frame)
+        except ConnectionError:
+            pass
+        await device.vibrate_motors(frame)
+        await settle()
+        return client.frames_received, client.get_current_frame()
+    assert run(scenario()) == (1, bytes(frame))
+
+
+def test_frames_queued_behind_a_write_are_copied():
+    async def scenario():
+        device, client = await connect()
+        data = bytearray(frame)
+        first = asyncio.ensure_future(device.vibrate_motors([1, 2, 3, 4]))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(device.vibrate_motors(data))
+        await asyncio.sleep(0)
+        data[0] = 0
+        await asyncio.gather(first, second)
+        await settle()
+        return client.get_current_frame()
+    assert run(scenario()) == bytes(frame)
+
+
+def test_frame_at_minimum_mtu_is_played():
+    async def scenario():
+        device, client = await connect(SimulatedBuzzClient(mtu_size=23))
+        await device.vibrate_motors(frame)
+        await settle()
+        return client.frames_received, client.oversized_writes
+    assert run(scenario()) == (1, 0)
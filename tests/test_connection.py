@@ -0,0 +1,57 @@
+import asyncio
+import collections
+import time
+
+from neosensory_python.connection import DeviceCache, NeoConnection
+from neosensory_python.simulator import SimulatedBuzzClient
+
+ScannedDevice = collections.namedtuple("ScannedDevice", "address name")
+
+
+class StaleClient(SimulatedBuzzClient):
+    # a cached device that is no longer around
+    async def connect(self, **kwargs):
+        await asyncio.sleep(60)
+
+
+def make_client(target, disconnected_callback=None):
+    address = getattr(target, "address", target)
+    cls = SimulatedBuzzClient if address == "LIVE" else StaleClient
+    client = cls(address, disconnected_callback=disconnected_callback)
+    clients.append(client)
+    return client
+
+
+clients = []
+
+
+def test_scan_runs_alongside_stale_cache_entries(tmp_path):
+    cache_path = str(tmp_path / "devices.json")
+    cache = DeviceCache(cache_path)
+    for i in range(4):
+        cache.remember("STALE:{}".format(i), "Buzz")
+    connection = NeoConnection(cache_path=cache_path, connect_timeout=0.2,
+        client_factory=make_client)
+
+    async def scan():
+        await asyncio.sleep(0.05)
+        return ScannedDevice("LIVE", "Buzz LIVE")
+    connection._scan = scan
+
+    async def scenario():
+        start = time.monotonic()
+        device = await connection.connect()
+        elapsed = time.monotonic() - start
+        await connection.disconnect()
+        return device, elapsed
+    loop = asyncio.new_event_loop()
+    try:
+        device, elapsed = loop.run_until_complete(scenario())
+    finally:
+        loop.close()
+    assert device.client.address == "LIVE"
+    # one stale attempt at most, not one per cache entry
+    assert elapsed < 0.4
+    assert cache.addresses()[0] == "LIVE"
+    assert not any(client.is_connected for client in clients
+        if client.address != "LIVE")
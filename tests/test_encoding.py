@@ -0,0 +1,41 @@
+import asyncio
+
+import numpy as np
+
+from neosensory_python import NeoDevice
+from neosensory_python.encoding import MotorCommandEncoder, \
+    decode_vibrate_command, get_vibrate_command_length
+from neosensory_python.simulator import SimulatedBuzzClient
+
+
+def test_round_trip():
+    encoder = MotorCommandEncoder(max_bytes=4)
+    frames = np.arange(32, dtype=np.uint8).reshape(8, 4)
+    for frame_data in ([1, 2, 3, 4], b"\x00\xff\x10\x20", frames,
+            frames[::2], frames[:, ::-1], memoryview(frames)[1::3]):
+        expected = np.array(frame_data, dtype=np.uint8).tobytes() \
+            if isinstance(frame_data, list) else \
+            memoryview(frame_data).tobytes()
+        command = encoder.encode(frame_data)
+        assert len(command) == get_vibrate_command_length(len(expected))
+        assert decode_vibrate_command(command) == expected
+
+
+def test_strided_frames_are_played():
+    async def scenario():
+        client = SimulatedBuzzClient()
+        await client.connect()
+        device = NeoDevice(client)
+        await device.start_developer_session()
+        frames = np.arange(32, dtype=np.uint8).reshape(8, 4)
+        await device.vibrate_motors(frames[::2])
+        return client.frames_received, client.commands[-1]
+    loop = asyncio.new_event_loop()
+    try:
+        frames_received, command = loop.run_until_complete(scenario())
+    finally:
+        loop.close()
+    frames = np.arange(32, dtype=np.uint8).reshape(8, 4)
+    assert frames_received == 4
+    assert decode_vibrate_command(command.encode()) == \
+        frames[::2].tobytes()
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from neosensory_python.interpolation import KeyframeInterpolator
+
+period = 0.016
+
+
+def test_linear_frames():
+    interpolator = KeyframeInterpolator(frame_period=period)
+    frames = np.array(list(interpolator.frames([(0.0, [0, 0, 0, 0]),
+        (0.16, [160, 0, 0, 0])])))
+    assert len(frames) == 11
+    assert list(frames[:, 0]) == list(range(0, 161, 16))
+
+
+def test_flush_ends_on_last_keyframe():
+    interpolator = KeyframeInterpolator(frame_period=period)
+    frames = list(interpolator.frames([(0.0, [0, 0, 0, 0]),
+        (0.1, [255, 0, 0, 0]), (0.2, [0, 0, 0, 255])]))
+    assert list(frames[-1]) == [0, 0, 0, 255]
+    # one frame per tick up to the last keyframe, then its values
+    assert len(frames) == int(0.2 / period) + 2
+
+
+@pytest.mark.parametrize("mode", ["linear", "cubic", "perceptual"])
+def test_frames_pass_through_keyframes(mode):
+    interpolator = KeyframeInterpolator(mode=mode, frame_period=period)
+    keyframes = [(i * 4 * period, [i * 50, 255 - i * 50, 0, 0])
+        for i in range(5)]
+    frames = list(interpolator.frames(keyframes))
+    for i, (_, values) in enumerate(keyframes):
+        assert np.abs(frames[i * 4].astype(int) - values).max() <= 1
+    assert len(frames) == 17
+
+
+def test_frames_as_keyframes_arrive():
+    interpolator = KeyframeInterpolator(mode="cubic", frame_period=period)
+    assert len(interpolator.add(0.0, [0] * 4)) == 0
+    assert len(interpolator.add(0.08, [100] * 4)) == 0
+    # cubic frames wait for the keyframe after their segment
+    assert len(interpolator.add(0.16, [0] * 4)) == 5
+    assert len(interpolator.flush()) == 6
+
+
+def test_several_devices():
+    interpolator = KeyframeInterpolator(num_devices=2, frame_period=period)
+    interpolator.add(0.0, np.zeros((2, 4)))
+    frames = interpolator.add(0.032, [[100] * 4, [200] * 4])
+    assert frames.shape == (2, 2, 4)
+    assert list(frames[1, :, 0]) == [50, 100]
+
+
+def test_keyframes_must_advance():
+    interpolator = KeyframeInterpolator()
+    interpolator.add(1.0, [0] * 4)
+    with pytest.raises(ValueError):
+        interpolator.add(1.0, [0] * 4)
+    with pytest.raises(ValueError):
+        interpolator.add(2.0, [0] * 3)
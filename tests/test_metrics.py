@@ -0,0 +1,72 @@
+import asyncio
+
+from neosensory_python import NeoDevice
+from neosensory_python.metrics import DeviceMetrics, LatencyHistogram, \
+    get_command_kind
+from neosensory_python.simulator import SimulatedBuzzClient
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+async def connect(client):
+    await client.connect()
+    device = NeoDevice(client)
+    await device.start_developer_session()
+    device.enable_metrics()
+    return device
+
+
+def test_histogram_buckets():
+    histogram = LatencyHistogram((0.001, 0.01))
+    for seconds in (0.0005, 0.001, 0.005, 0.5):
+        histogram.record(seconds)
+    snapshot = histogram.snapshot()
+    assert snapshot["counts"] == [2, 1, 1]
+    assert snapshot["count"] == 4
+    assert snapshot["max"] == 0.5
+    assert abs(snapshot["mean"] - 0.5065 / 4) < 1e-12
+
+
+def test_writes_recorded_per_command():
+    exported = []
+    metrics = DeviceMetrics(exported.append)
+    metrics.record_write(b'motors vibrate "AAAA"\n', 0.002, 1)
+    metrics.record_write(b"device battery_soc\n", 0.004)
+    metrics.record_queue_depth(3)
+    metrics.record_queue_depth(1)
+    snapshot = metrics.export()
+    assert exported == [snapshot]
+    assert snapshot["writes"] == 2
+    assert snapshot["frames_written"] == 1
+    assert snapshot["queue_depth"] == 1
+    assert snapshot["max_queue_depth"] == 3
+    assert sorted(snapshot["latencies"]) == ["device battery_soc",
+        "motors vibrate"]
+    assert get_command_kind(b'motors vibrate "AAAA"') == "motors vibrate"
+
+
+def test_frames_after_an_underrun_are_late():
+    async def scenario():
+        client = SimulatedBuzzClient(latency=0.02)
+        device = await connect(client)
+        # the second write lands after the first frame has played out
+        await device.vibrate_motors([255, 0, 0, 0])
+        await device.vibrate_motors([0, 255, 0, 0, 0, 0, 255, 0])
+        return device.metrics.late_frames, client.underruns
+    assert run(scenario()) == (2, 1)
+
+
+def test_frames_ahead_of_the_queue_are_not_late():
+    async def scenario():
+        client = SimulatedBuzzClient()
+        device = await connect(client)
+        await device.vibrate_motors([255, 0, 0, 0] * 4)
+        await device.vibrate_motors([0, 255, 0, 0] * 4)
+        return device.metrics.late_frames, client.underruns
+    assert run(scenario()) == (0, 0)
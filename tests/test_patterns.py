@@ -0,0 +1,63 @@
+import asyncio
+import os
+
+import numpy as np
+
+from neosensory_python import NeoDevice
+from neosensory_python.patterns import CompiledPattern, PatternCache, \
+    compile_frames, illusion_sweep, pulse
+from neosensory_python.simulator import SimulatedBuzzClient
+
+
+def frames_of(pattern):
+    return [bytes(command) for command, _ in pattern.writes()]
+
+
+def test_lambdas_do_not_share_a_key(tmp_path):
+    cache = PatternCache(directory=str(tmp_path))
+    a = cache.get(lambda n: pulse([255, 0, 0, 0], n, n), 3)
+    b = cache.get(lambda n: pulse([0, 0, 0, 255], n, n), 3)
+    assert frames_of(a) != frames_of(b)
+    # names of lambdas are not unique, so they are not cached on disk
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_arrays_are_keyed_by_value():
+    cache = PatternCache()
+
+    def from_array(values):
+        return values.reshape(-1, 4)
+    first = np.zeros(2000, dtype=np.uint8)
+    second = first.copy()
+    second[1000] = 255
+    assert cache.get(from_array, first) is not cache.get(from_array, second)
+    assert cache.get(from_array, first) is cache.get(from_array, first.copy())
+
+
+def test_truncated_file_is_rejected(tmp_path):
+    path = str(tmp_path / "pulse.neop")
+    compile_frames(pulse([255, 0, 0, 0], 20, 20)).save(path)
+    with open(path, "rb+") as f:
+        f.truncate(os.path.getsize(path) - 5)
+    try:
+        CompiledPattern.load(path)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("truncated pattern file was loaded")
+
+
+def test_default_pattern_plays_at_minimum_mtu():
+    async def scenario():
+        client = SimulatedBuzzClient(mtu_size=23)
+        await client.connect()
+        device = NeoDevice(client)
+        await device.start_developer_session()
+        sent = await device.play_pattern(PatternCache().get(illusion_sweep,
+            100))
+        return sent, client.frames_received, client.oversized_writes
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(scenario()) == (100, 100, 0)
+    finally:
+        loop.close()
@@ -0,0 +1,53 @@
+import asyncio
+
+from neosensory_python import NeoDevice
+from neosensory_python.pool import NeoDevicePool
+from neosensory_python.simulator import SimulatedBuzzClient
+
+
+def test_failed_writes_count_as_dropped():
+    async def scenario():
+        devices = []
+        for _ in range(3):
+            client = SimulatedBuzzClient()
+            await client.connect()
+            device = NeoDevice(client)
+            await device.start_developer_session()
+            devices.append(device)
+        await devices[1].client.disconnect()
+        pool = NeoDevicePool(devices)
+        ticks = await pool.stream_frames([[255, 0, 0, 0]] * 20,
+            broadcast=True)
+        return ticks, pool.dropped_frames, pool.errors
+    loop = asyncio.new_event_loop()
+    try:
+        ticks, dropped, errors = loop.run_until_complete(scenario())
+    finally:
+        loop.close()
+    assert dropped == [0, ticks, 0]
+    assert isinstance(errors[1], ConnectionError)
+    assert errors[0] is None and errors[2] is None
+
+
+def test_second_stream_on_a_pool_drops_nothing():
+    async def scenario():
+        devices = []
+        for _ in range(2):
+            client = SimulatedBuzzClient()
+            await client.connect()
+            device = NeoDevice(client)
+            await device.start_developer_session()
+            devices.append(device)
+        pool = NeoDevicePool(devices)
+        frames = [[255, 0, 0, 0]] * 100
+        await pool.stream_frames(frames, broadcast=True)
+        await pool.stream_frames(frames, broadcast=True)
+        return pool.dropped_frames, [device.client.overflowed_frames
+            for device in devices]
+    loop = asyncio.new_event_loop()
+    try:
+        dropped, overflowed = loop.run_until_complete(scenario())
+    finally:
+        loop.close()
+    assert dropped == [0, 0]
+    assert overflowed == [0, 0]
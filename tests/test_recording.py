@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from neosensory_python import NeoDevice, motor_frame_period, recording
+from neosensory_python.encoding import decode_vibrate_command
+from neosensory_python.recording import FrameLog, FrameRecorder, \
+    FrameReplayer
+from neosensory_python.simulator import SimulatedBuzzClient
+
+
+def test_block_rollover_within_a_write(tmp_path, monkeypatch):
+    # 40 ms blocks, so the second write spills into a new block
+    monkeypatch.setattr(recording, "_max_offset", 40000)
+    path = str(tmp_path / "frames.neor")
+    frames = bytes(range(20))
+    with FrameRecorder(path) as recorder:
+        recorder.record(frames[:4], 1, recorder._start)
+        recorder.record(frames[4:], 4, recorder._start + 0.016)
+    log = FrameLog(path)
+    try:
+        assert len(log) == 5
+        recorded = b"".join(bytes(log.frames(i, i + 1)) for i in range(5))
+        assert recorded == frames
+        assert [round(log.timestamp(i), 3) for i in range(5)] == \
+            [0.0, 0.016, 0.032, 0.048, 0.064]
+    finally:
+        log.close()
+
+
+def record_log(path, num_frames, block_frames=256):
+    # frame i has motor values (i, 0, 0, 0), one frame per device tick
+    with FrameRecorder(path, block_frames=block_frames) as recorder:
+        for i in range(num_frames):
+            recorder.record(bytes([i, 0, 0, 0]), 1,
+                recorder._start + i * motor_frame_period)
+
+
+def replay(path, speed=1.0, seek=None):
+    async def scenario():
+        client = SimulatedBuzzClient()
+        await client.connect()
+        device = NeoDevice(client)
+        await device.start_developer_session()
+        replayer = FrameReplayer(path, device, speed)
+        if seek is not None:
+            replayer.seek(seek)
+        try:
+            sent = await replayer.play()
+        finally:
+            replayer.log.close()
+        frames = b"".join(decode_vibrate_command(command.encode())
+            for command in client.commands
+            if command.startswith("motors vibrate"))
+        return sent, list(frames[::4])
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(scenario())
+    finally:
+        loop.close()
+
+
+@pytest.mark.parametrize("block_frames", [7, 256])
+def test_replay_at_recorded_speed(tmp_path, block_frames):
+    path = str(tmp_path / "frames.neor")
+    record_log(path, 40, block_frames)
+    assert replay(path) == (40, list(range(40)))
+
+
+def test_replay_faster_skips_frames(tmp_path):
+    path = str(tmp_path / "frames.neor")
+    record_log(path, 40, 7)
+    assert replay(path, speed=2.0) == (20, list(range(0, 40, 2)))
+
+
+def test_replay_slower_repeats_frames(tmp_path):
+    path = str(tmp_path / "frames.neor")
+    record_log(path, 20, 7)
+    sent, frames = replay(path, speed=0.5)
+    assert sent == 40
+    assert frames == [i // 2 for i in range(40)]
+
+
+def test_replay_from_seek_position(tmp_path):
+    path = str(tmp_path / "frames.neor")
+    record_log(path, 40, 7)
+    assert replay(path, seek=25 * motor_frame_period) == \
+        (15, list(range(25, 40)))
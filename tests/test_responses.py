@@ -0,0 +1,34 @@
+from neosensory_python.responses import ResponseParser
+
+
+def feed_all(chunks):
+    parser = ResponseParser()
+    messages = []
+    for chunk in chunks:
+        messages += parser.feed(chunk)
+    return messages
+
+
+def test_text_after_prompt_is_kept():
+    assert feed_all([b"ncli> hello", b" world\r\n"]) == ["hello world"]
+
+
+def test_error_split_after_prompt():
+    data = b"ncli> Error: developer authorization required\r\nncli> "
+    chunks = [data[i:i + 20] for i in range(0, len(data), 20)]
+    assert feed_all(chunks) == ["Error: developer authorization required"]
+
+
+def test_fragmented_json():
+    data = (b'{"type": "battery_soc", "data": {"battery_soc": 87}}'
+        b"\r\nncli> OK\r\n")
+    for size in (1, 7, 20):
+        chunks = [data[i:i + size] for i in range(0, len(data), size)]
+        assert feed_all(chunks) == [{"type": "battery_soc",
+            "data": {"battery_soc": 87}}, "OK"]
+
+
+def test_braces_and_quotes_inside_strings():
+    data = b'{"text": "a } b { \\" }"}\r\nncli> '
+    chunks = [data[i:i + 3] for i in range(0, len(data), 3)]
+    assert feed_all(chunks) == [{"text": 'a } b { " }'}]
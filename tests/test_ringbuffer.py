@@ -0,0 +1,31 @@
+import array
+
+import pytest
+
+from neosensory_python.ringbuffer import FrameRingBuffer
+
+
+def test_frames_wrap_around():
+    ring = FrameRingBuffer(capacity=4)
+    assert ring.write(bytes(range(12))) == 3
+    assert ring.read(2) == (bytes(range(8)), 2)
+    assert ring.write(bytes(range(12, 24))) == 3
+    assert ring.free == 0
+    assert ring.read(8) == (bytes(range(8, 24)), 4)
+    ring.close()
+
+
+def test_multi_byte_items_are_rejected():
+    ring = FrameRingBuffer(capacity=4)
+    with pytest.raises(ValueError):
+        ring.write(array.array("q", [255, 0, 0, 0]))
+    assert len(ring) == 0
+    ring.close()
+
+
+def test_strided_frames_are_copied_in_order():
+    ring = FrameRingBuffer(capacity=4)
+    frames = memoryview(bytes(range(16))).cast("B", (4, 4))
+    assert ring.write(frames[::2]) == 2
+    assert ring.read(4) == (bytes(range(4)) + bytes(range(8, 12)), 2)
+    ring.close()
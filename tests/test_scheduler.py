@@ -0,0 +1,84 @@
+import asyncio
+import time
+
+from neosensory_python import motor_frame_period
+from neosensory_python.scheduler import FrameScheduler
+
+
+class SlowDevice:
+    # takes a while to write each frame, like a device over a slow link
+    metrics = None
+
+    def __init__(self, write_time=0.0):
+        self.write_time = write_time
+        self.frames = []
+
+    async def vibrate_motors(self, frame):
+        await asyncio.sleep(self.write_time)
+        self.frames.append(list(frame))
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_write_time_does_not_add_up():
+    device = SlowDevice(write_time=0.005)
+    scheduler = FrameScheduler(device)
+
+    async def scenario():
+        start = time.monotonic()
+        sent = await scheduler.play([[i, 0, 0, 0] for i in range(30)])
+        return sent, time.monotonic() - start
+    sent, elapsed = run(scenario())
+    assert sent == 30
+    assert scheduler.dropped_frames == 0
+    # the last frame is due 29 ticks after the first
+    assert 29 * motor_frame_period <= elapsed \
+        < 29 * motor_frame_period + 0.025
+
+
+def test_stale_frames_are_skipped():
+    device = SlowDevice()
+    scheduler = FrameScheduler(device)
+    ticks = []
+
+    def source(tick):
+        if tick >= 30:
+            return None
+        if tick == 5:
+            # stall the loop for several ticks
+            time.sleep(6 * motor_frame_period)
+        ticks.append(tick)
+        return [tick, 0, 0, 0]
+    sent = run(scheduler.play(source))
+    assert scheduler.dropped_frames >= 4
+    assert sent + scheduler.dropped_frames == 30
+    assert ticks[:6] == list(range(6))
+    # playback jumped ahead to the interval that was due
+    assert ticks[6] - ticks[5] == scheduler.dropped_frames + 1
+
+
+def test_stop_ends_playback():
+    device = SlowDevice()
+    scheduler = FrameScheduler(device)
+
+    def source(tick):
+        if tick == 10:
+            scheduler.stop()
+        return [tick, 0, 0, 0]
+    assert run(scheduler.play(source)) == 11
+    assert run(scheduler.play([[0, 0, 0, 0]] * 3)) == 3
+
+
+def test_stop_before_play():
+    device = SlowDevice()
+    scheduler = FrameScheduler(device)
+    scheduler.stop()
+    assert run(scheduler.play([[0, 0, 0, 0]] * 3)) == 0
+    assert device.frames == []
+    assert run(scheduler.play([[0, 0, 0, 0]] * 3)) == 3
@@ -0,0 +1,50 @@
+import asyncio
+import time
+
+from neosensory_python import NeoDevice, motor_frame_period
+from neosensory_python.simulator import SimulatedBuzzClient
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+async def stream(frames, latency):
+    client = SimulatedBuzzClient(latency=latency)
+    await client.connect()
+    device = NeoDevice(client)
+    await device.start_developer_session()
+    device.enable_metrics()
+    sent = await device.stream_frames(frames)
+    return sent, device.metrics.writes, client.underruns, \
+        client.overflowed_frames
+
+
+async def paced_frames(num_frames):
+    # one frame per device tick, on absolute deadlines
+    start = time.monotonic()
+    for i in range(num_frames):
+        yield [i % 256, 0, 0, 0]
+        await asyncio.sleep(max(0, start + (i + 1) * motor_frame_period
+            - time.monotonic()))
+
+
+def test_stream_keeps_up_with_write_latency():
+    frames = [[i % 256, 0, 0, 0] for i in range(100)]
+    sent, writes, underruns, overflowed = run(stream(frames, 0.02))
+    assert sent == 100
+    assert writes < 20
+    assert underruns == 0
+    assert overflowed == 0
+
+
+def test_paced_stream_keeps_up_with_write_latency():
+    sent, writes, underruns, overflowed = run(stream(paced_frames(60),
+        0.01))
+    assert sent == 60
+    assert underruns == 0
+    assert overflowed == 0